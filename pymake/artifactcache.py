@@ -0,0 +1,273 @@
+"""
+A content-addressed cache of the files made by commands, so that a target
+which was already made from the same inputs, in this tree or another, can be
+restored instead of being remade.
+
+The key of a cache entry is a digest of the target's expanded commands, the
+contents of its prerequisites and the variables exported to the commands.
+The outputs of an entry are the target itself and, if it sets .DEPFILE, its
+dependency file.
+
+Backends implement get() and put(). LocalStore keeps entries in a directory,
+evicting the least recently used ones when it grows past its size limit.
+Outputs are restored as copies, never links into the store, so that
+commands which later rewrite an output in place can't change the entry.
+HTTPStore keeps entries on an HTTP server, using GET and PUT.
+"""
+
+import os, stat, errno, shutil, hashlib, logging
+import util
+
+try:
+    from urllib2 import urlopen, Request, HTTPError, URLError
+except ImportError:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError, URLError
+
+_log = logging.getLogger('pymake.artifactcache')
+
+# Increase this when the meaning of keys changes.
+FORMAT = 1
+
+def getkey(target, commands, prerequisites, environment):
+    """
+    Compute the key for `target` made by `commands`, given a list of
+    (prerequisite, digest) pairs and a sorted list of exported (name, value)
+    pairs.
+    """
+    h = hashlib.sha1()
+    h.update(repr((FORMAT, target, [c.cline for c in commands],
+                   prerequisites, environment)).encode('utf-8'))
+    return h.hexdigest()
+
+def _replace(tmppath, path):
+    try:
+        os.rename(tmppath, path)
+    except OSError:
+        # Windows can't rename over an existing file
+        os.remove(path)
+        os.rename(tmppath, path)
+
+def _makedirs(dir):
+    try:
+        os.makedirs(dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+class Backend(object):
+    """
+    The interface of artifact cache backends.
+    """
+    def get(self, key, paths):
+        """
+        Restore the outputs stored under `key` to `paths`, in order. Return
+        False if there is no such entry.
+        """
+        raise NotImplementedError()
+
+    def put(self, key, paths):
+        """
+        Store the files at `paths` under `key`.
+        """
+        raise NotImplementedError()
+
+class LocalStore(Backend):
+    def __init__(self, dir, maxsize):
+        self.dir = dir
+        self.maxsize = maxsize
+        self._size = None # total size of the entries, once scanned
+
+    def _entrypath(self, key):
+        return os.path.join(self.dir, key[:2], key)
+
+    def get(self, key, paths):
+        entry = self._entrypath(key)
+        files = [os.path.join(entry, str(i)) for i in range(len(paths))]
+        for f in files:
+            if not os.path.isfile(f):
+                return False
+
+        try:
+            for f, path in zip(files, paths):
+                self._restore(f, path)
+            # the mtime of an entry is when it was last used
+            os.utime(entry, None)
+        except (OSError, IOError) as e:
+            _log.warning("Could not restore %s from the artifact cache: %s", key, e)
+            return False
+        return True
+
+    def _restore(self, f, path):
+        _makedirs(os.path.dirname(path))
+        tmppath = path + '.pymake-tmp'
+        if os.path.lexists(tmppath):
+            os.remove(tmppath)
+        # a fresh copy, which is writable and has the current time as its
+        # mtime, whatever the entry's
+        shutil.copyfile(f, tmppath)
+        _replace(tmppath, path)
+
+    def put(self, key, paths):
+        entry = self._entrypath(key)
+        if os.path.isdir(entry):
+            os.utime(entry, None)
+            return
+
+        tmpentry = '%s.tmp%i' % (entry, os.getpid())
+        size = 0
+        try:
+            _makedirs(tmpentry)
+            for i, path in enumerate(paths):
+                f = os.path.join(tmpentry, str(i))
+                shutil.copyfile(path, f)
+                os.chmod(f, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                size += os.path.getsize(f)
+            os.rename(tmpentry, entry)
+        except (OSError, IOError) as e:
+            _log.warning("Could not store %s in the artifact cache: %s", key, e)
+            _rmtree(tmpentry)
+            return
+
+        if self._size is None:
+            self._size = sum((s for mtime, s, e in self._scan()))
+        else:
+            self._size += size
+
+        if self._size > self.maxsize:
+            self.evict(self.maxsize * 9 // 10)
+
+    def _scan(self):
+        """
+        Return a list of (mtime, size, path) for every entry.
+        """
+        entries = []
+        for prefix in os.listdir(self.dir):
+            prefixdir = os.path.join(self.dir, prefix)
+            if not os.path.isdir(prefixdir):
+                continue
+            for key in os.listdir(prefixdir):
+                entry = os.path.join(prefixdir, key)
+                try:
+                    mtime = os.stat(entry).st_mtime
+                    size = sum((os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry)))
+                except OSError:
+                    continue
+                entries.append((mtime, size, entry))
+        return entries
+
+    def evict(self, size):
+        """
+        Remove the least recently used entries until the cache is no larger
+        than `size` bytes.
+        """
+        entries = self._scan()
+        entries.sort()
+        total = sum((s for mtime, s, e in entries))
+        for mtime, s, entry in entries:
+            if total <= size:
+                break
+            _log.info("Evicting %s from the artifact cache", os.path.basename(entry))
+            _rmtree(entry)
+            total -= s
+        self._size = total
+
+def _rmtree(path):
+    def onerror(func, path, excinfo):
+        # stored files are read-only, which Windows won't remove
+        try:
+            os.chmod(path, stat.S_IWUSR | stat.S_IRUSR)
+            func(path)
+        except OSError:
+            pass
+    shutil.rmtree(path, onerror=onerror)
+
+class HTTPStore(Backend):
+    """
+    Entries on an HTTP server: output i of the entry `key` is at
+    <url>/<key>/<i>.
+    """
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def get(self, key, paths):
+        tmppaths = []
+        try:
+            try:
+                for i, path in enumerate(paths):
+                    try:
+                        r = urlopen('%s/%s/%i' % (self.url, key, i), timeout=self.timeout)
+                    except HTTPError as e:
+                        if e.code != 404:
+                            _log.warning("Could not fetch %s from the artifact cache: %s", key, e)
+                        return False
+                    try:
+                        body = r.read()
+                    finally:
+                        r.close()
+
+                    _makedirs(os.path.dirname(path))
+                    tmppath = path + '.pymake-tmp'
+                    fd = open(tmppath, 'wb')
+                    try:
+                        fd.write(body)
+                    finally:
+                        fd.close()
+                    tmppaths.append(tmppath)
+            except (URLError, OSError, IOError) as e:
+                _log.warning("Could not fetch %s from the artifact cache: %s", key, e)
+                return False
+
+            for tmppath, path in zip(tmppaths, paths):
+                _replace(tmppath, path)
+            tmppaths = []
+            return True
+        finally:
+            for tmppath in tmppaths:
+                os.remove(tmppath)
+
+    def put(self, key, paths):
+        try:
+            for i, path in enumerate(paths):
+                fd = open(path, 'rb')
+                try:
+                    body = fd.read()
+                finally:
+                    fd.close()
+                req = Request('%s/%s/%i' % (self.url, key, i), data=body)
+                req.get_method = lambda: 'PUT'
+                urlopen(req, timeout=self.timeout).close()
+        except (URLError, OSError, IOError) as e:
+            _log.warning("Could not store %s in the artifact cache: %s", key, e)
+
+# URL scheme -> backend factory, called with the URL and the size limit
+backends = {
+    'http': lambda url, maxsize: HTTPStore(url),
+    'https': lambda url, maxsize: HTTPStore(url),
+}
+
+_caches = {}
+
+def getcache(location, workdir, maxsize):
+    """
+    Get the backend for `location`, which is either a URL whose scheme is
+    registered in `backends` or a local directory. All the makes running in
+    this process share one backend per location.
+    """
+    scheme, sep, rest = location.partition('://')
+    isurl = sep and scheme in backends
+    if isurl:
+        key = location
+    else:
+        key = util.normaljoin(workdir, location)
+
+    cache = _caches.get(key)
+    if cache is None:
+        if isurl:
+            cache = backends[scheme](location, maxsize)
+        else:
+            _makedirs(key)
+            cache = LocalStore(key, maxsize)
+        _caches[key] = cache
+    return cache
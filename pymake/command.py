@@ -11,7 +11,7 @@ except when a submake specifies -j1 when the parent make is building in parallel
 
 import os, subprocess, sys, logging, time, traceback, re
 from optparse import OptionParser
-import data, parserdata, process, util
+import data, graph, parserdata, process, snapshot, commandlog, digests, depslog, artifactcache, util
 from pymake import errors
 
 # TODO: If this ever goes from relocatable package to system-installed, this may need to be
@@ -92,6 +92,13 @@ class _MakeContext(object):
 
         self.restarts = 0
 
+        self.snapshotpath = None
+        if options.snapshot:
+            self.snapshotpath = util.normaljoin(workdir, options.snapshot)
+            self.snapshotkey = snapshot.getkey(workdir, sorted(env.items()), makeflags, overrides,
+                                               list(targets), options.makefiles, makelevel,
+                                               options.keepgoing, options.silent, options.justprint)
+
         self.remakecb(True)
 
     def remakecb(self, remade, error=None):
@@ -103,6 +110,15 @@ class _MakeContext(object):
         if remade:
             if self.restarts > 0:
                 _log.info("make.py[%i]: Restarting makefile parsing", self.makelevel)
+                if self.resume():
+                    return
+            elif self.snapshotpath is not None:
+                self.makefile = snapshot.load(self.snapshotpath, self.snapshotkey, self.context)
+                if self.makefile is not None:
+                    self.setcommandlog()
+                    self.restarts += 1
+                    self.remakemakefiles()
+                    return
 
             self.makefile = data.Makefile(restarts=self.restarts,
                                           make='%s %s' % (sys.executable.replace('\\', '/'), makepypath.replace('\\', '/')),
@@ -116,21 +132,28 @@ class _MakeContext(object):
                                           keepgoing=self.options.keepgoing,
                                           silent=self.options.silent,
                                           justprint=self.options.justprint)
+            self.makefile.checkpoints = []
+            self.setcommandlog()
 
             self.restarts += 1
 
             try:
                 self.ostmts.execute(self.makefile)
-                for f in self.options.makefiles:
-                    self.makefile.include(f)
+                self.makefile.includemakefiles(self.options.makefiles)
                 self.makefile.finishparsing()
-                self.makefile.remakemakefiles(self.remakecb)
+                if self.snapshotpath is not None and self.restarts == 1:
+                    snapshot.save(self.makefile, self.snapshotpath, self.snapshotkey)
             except errors.MakeError as e:
                 print(e)
                 self.context.defer(self.cb, 2)
+                return
 
+            self.remakemakefiles()
             return
 
+        # parsing won't be restarted
+        self.makefile.checkpoints = None
+
         if len(self.targets) == 0:
             if self.makefile.defaulttarget is None:
                 print("No target specified and no default target found.")
@@ -139,21 +162,160 @@ class _MakeContext(object):
 
             _log.info("Making default target %s", self.makefile.defaulttarget)
             self.realtargets = [self.makefile.defaulttarget]
-            self.tstack = ['<default-target>']
+            self.tstack = data.TargetStack('<default-target>')
         else:
             self.realtargets = self.targets
-            self.tstack = ['<command-line>']
+            self.tstack = data.TargetStack('<command-line>')
+
+        if self.options.question:
+            self.question()
+            return
+
+        if self.makefile.context.jcount > 1 and len(self.realtargets) > 1:
+            self.makegoalsparallel()
+            return
 
         self.makefile.gettarget(self.realtargets.pop(0)).make(self.makefile, self.tstack, cb=self.makecb)
 
+    def resume(self):
+        """
+        Resume parsing from the last valid checkpoint before the first
+        included makefile which was remade. Return False if there is none,
+        and parsing must start from scratch.
+        """
+        checkpoints = self.makefile.checkpoints
+        if not checkpoints:
+            return False
+
+        first = len(self.makefile.included)
+        for i, (f, required) in enumerate(self.makefile.included):
+            if self.makefile.gettarget(f).wasremade:
+                first = i
+                break
+
+        for i in range(len(checkpoints) - 1, -1, -1):
+            checkpoint = checkpoints[i]
+            if checkpoint.included > first:
+                continue
+
+            reason = checkpoint.checkinputs()
+            if reason is not None:
+                _log.info("make.py[%i]: Can't resume parsing from checkpoint %i: %s", self.makelevel, i, reason)
+                continue
+
+            _log.info("make.py[%i]: Resuming parsing from checkpoint %i, after %i included makefiles", self.makelevel, i, checkpoint.included)
+            self.makefile, frames = checkpoint.restore(self.context)
+            self.makefile.checkpoints = checkpoints[:i]
+            self.makefile.variables.set('MAKE_RESTARTS', data.Variables.FLAVOR_SIMPLE,
+                                        data.Variables.SOURCE_AUTOMATIC, str(self.restarts))
+            self.setcommandlog()
+
+            self.restarts += 1
+
+            try:
+                parserdata.resumeexecution(self.makefile, frames)
+                self.makefile.includemakefiles(self.options.makefiles, checkpoint.toplevel + 1)
+                self.makefile.finishparsing()
+            except errors.MakeError as e:
+                print(e)
+                self.context.defer(self.cb, 2)
+                return True
+
+            self.remakemakefiles()
+            return True
+
+        return False
+
+    def setcommandlog(self):
+        if self.options.commandlog:
+            self.makefile.commandlog = commandlog.getlog(util.normaljoin(self.workdir, self.options.commandlog))
+        if self.options.contentdigests:
+            self.makefile.digestdb = digests.getdatabase(util.normaljoin(self.workdir, self.options.contentdigests))
+        if self.options.depslog:
+            self.makefile.depslog = depslog.getlog(util.normaljoin(self.workdir, self.options.depslog))
+        if self.options.artifactcache:
+            self.makefile.artifactcache = artifactcache.getcache(self.options.artifactcache, self.workdir,
+                                                                 self.options.artifactcachesize * 1024 * 1024)
+
+    def remakemakefiles(self):
+        try:
+            if self.makefile.depslog is not None:
+                self.makefile.applydepslog()
+            if self.options.prefetchmtimes:
+                self.makefile.prefetchmtimes(self.options.prefetchmtimes)
+            self.makefile.remakemakefiles(self.remakecb)
+        except errors.MakeError as e:
+            print(e)
+            self.context.defer(self.cb, 2)
+
+    def question(self):
+        """
+        Exit with status 1 if any goal is out of date, without running any
+        commands.
+        """
+        try:
+            g = graph.DependencyGraph(self.makefile, self.realtargets, self.tstack)
+            outofdate = g.outofdatetargets()
+        except errors.MakeError as e:
+            print(e)
+            self.context.defer(self.cb, 2)
+            return
+
+        for t in outofdate:
+            _log.info("make.py[%i]: '%s' is out of date", self.makelevel, t)
+
+        self.context.defer(self.cb, len(outofdate) and 1 or 0)
+
+    def makegoalsparallel(self):
+        """
+        Make all the goals at once. As with GNU make, once a goal fails no
+        more commands are started unless -k was given, and make exits with
+        status 2 when the commands already running have finished.
+        """
+        goals = self.realtargets
+        self.realtargets = []
+        self.goalsremaining = len(goals)
+        self.goalerror = False
+        for goal in goals:
+            self.makefile.context.defer(self._startgoalparallel, goal)
+
+    def _startgoalparallel(self, goal):
+        if self.makefile.error and not self.makefile.keepgoing:
+            self._goalfinishedparallel(True, False)
+        else:
+            self.makefile.gettarget(goal).make(self.makefile, self.tstack, self._goalfinishedparallel)
+
+    def _goalfinishedparallel(self, error, didanything):
+        assert error in (True, False)
+
+        if error:
+            self.goalerror = True
+
+        self.goalsremaining -= 1
+        if self.goalsremaining == 0:
+            self.makecb(self.goalerror, didanything)
+
     def makecb(self, error, didanything):
         assert error in (True, False)
 
+        if error or not len(self.realtargets):
+            if self.makefile.digestdb is not None:
+                self.makefile.digestdb.save()
+
         if error:
             self.context.defer(self.cb, 2)
             return
 
         if not len(self.realtargets):
+            _log.info("make.py[%i]: %i of %i file lookups so far were answered by the stat cache",
+                      self.makelevel, data.statcache.lookups - data.statcache.stats,
+                      data.statcache.lookups)
+            if self.makefile.digestdb is not None:
+                _log.info("make.py[%i]: %i files hashed so far", self.makelevel, self.makefile.digestdb.hashed)
+            times = self.makefile.resolvetimes
+            _log.info("make.py[%i]: dependency resolution took %.3fs (vpath %.3fs, implicit rule search %.3fs, pattern variables %.3fs)",
+                      self.makelevel, times['total'], times['vpath'], times['rulesearch'], times['variables'])
+
             if self.options.printdir:
                 print("make.py[%i]: Leaving directory '%s'" % (self.makelevel, self.workdir))
             sys.stdout.flush()
@@ -200,6 +362,22 @@ def main(args, env, cwd, cb):
         op.add_option('-n', '--just-print', '--dry-run', '--recon',
                       action="store_true",
                       dest="justprint", default=False)
+        op.add_option('-q', '--question', action="store_true",
+                      dest="question", default=False)
+        op.add_option('--prefetch-mtimes', type="int", metavar="THREADS",
+                      dest="prefetchmtimes", default=0)
+        op.add_option('--snapshot', metavar="FILE",
+                      dest="snapshot", default=None)
+        op.add_option('--command-log', metavar="FILE",
+                      dest="commandlog", default=None)
+        op.add_option('--content-digests', metavar="FILE",
+                      dest="contentdigests", default=None)
+        op.add_option('--deps-log', metavar="FILE",
+                      dest="depslog", default=None)
+        op.add_option('--artifact-cache', metavar="DIR|URL",
+                      dest="artifactcache", default=None)
+        op.add_option('--artifact-cache-size', type="int", metavar="MB",
+                      dest="artifactcachesize", default=1024)
 
         options, arguments1 = op.parse_args(parsemakeflags(env))
         options, arguments2 = op.parse_args(args, values=options)
@@ -229,6 +407,9 @@ def main(args, env, cwd, cb):
         if options.justprint:
             shortflags.append('n')
 
+        if options.question:
+            shortflags.append('q')
+
         loglevel = logging.WARNING
         if options.verbose:
             loglevel = logging.DEBUG
@@ -244,9 +425,37 @@ def main(args, env, cwd, cb):
         else:
             workdir = util.normaljoin(cwd, options.directory)
 
+        # File options are exported to submakes through MAKEFLAGS, and a
+        # submake with a different workdir must still find the same files.
+        for opt in ('commandlog', 'contentdigests', 'depslog'):
+            path = getattr(options, opt)
+            if path:
+                setattr(options, opt, os.path.abspath(util.normaljoin(workdir, path)))
+
+        if options.artifactcache:
+            scheme, sep, rest = options.artifactcache.partition('://')
+            if not (sep and scheme in artifactcache.backends):
+                options.artifactcache = os.path.abspath(util.normaljoin(workdir, options.artifactcache))
+
         if options.jobcount != 1:
             longflags.append('-j%i' % (options.jobcount,))
 
+        if options.prefetchmtimes:
+            longflags.append('--prefetch-mtimes=%i' % (options.prefetchmtimes,))
+
+        if options.commandlog:
+            longflags.append('--command-log=%s' % (options.commandlog,))
+
+        if options.contentdigests:
+            longflags.append('--content-digests=%s' % (options.contentdigests,))
+
+        if options.depslog:
+            longflags.append('--deps-log=%s' % (options.depslog,))
+
+        if options.artifactcache:
+            longflags.append('--artifact-cache=%s' % (options.artifactcache,))
+            longflags.append('--artifact-cache-size=%i' % (options.artifactcachesize,))
+
         makeflags = ''.join(shortflags)
         if len(longflags):
             makeflags += ' ' + ' '.join(longflags)
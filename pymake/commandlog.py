@@ -0,0 +1,105 @@
+"""
+A log of the commands used to make each target, so that targets can be
+remade when their commands change even though their prerequisites haven't.
+
+The log is an append-only text file. Each line records the hash of a target's
+commands (see data.getcommandsignatureforrule), how long they took to run in
+milliseconds, and the path of the target:
+
+    <hash> <duration> <target>
+
+Later lines override earlier ones. The file is rewritten without the
+overridden lines when it is loaded and has grown too large.
+"""
+
+import os, hashlib
+
+_header = '# pymake command log v2\n'
+
+def hashcommands(signature):
+    """
+    Hash the signature of some commands, as returned by
+    Rule.getcommandsignature.
+    """
+    h = hashlib.sha1()
+    for s in signature:
+        h.update(('%s\n' % (s,)).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+class CommandLog(object):
+    def __init__(self, path):
+        self.path = path
+        self._entries = {} # target -> (hash, duration)
+
+        lines = 0
+        try:
+            fd = open(path, 'r')
+        except IOError:
+            fd = None
+
+        if fd is not None:
+            try:
+                if fd.readline() == _header:
+                    for line in fd:
+                        parts = line.rstrip('\n').split(' ', 2)
+                        if len(parts) != 3:
+                            continue
+                        lines += 1
+                        self._entries[parts[2]] = (parts[0], int(parts[1]))
+            finally:
+                fd.close()
+
+        if lines == 0 or lines > 3 * len(self._entries) + 100:
+            self._rewrite()
+
+        self._fd = open(path, 'a')
+
+    def _rewrite(self):
+        tmppath = self.path + '.tmp'
+        fd = open(tmppath, 'w')
+        try:
+            fd.write(_header)
+            for target, (commandhash, duration) in sorted(self._entries.items()):
+                fd.write('%s %i %s\n' % (commandhash, duration, target))
+        finally:
+            fd.close()
+
+        try:
+            os.rename(tmppath, self.path)
+        except OSError:
+            # Windows can't rename over an existing file
+            os.remove(self.path)
+            os.rename(tmppath, self.path)
+
+    def gethash(self, target):
+        """
+        Return the hash of the commands last used to make `target`, or None.
+        """
+        entry = self._entries.get(target)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def record(self, target, commandhash, duration):
+        """
+        Record that `target` was made using commands with `commandhash`, which
+        took `duration` seconds.
+        """
+        duration = int(duration * 1000)
+        self._entries[target] = (commandhash, duration)
+        self._fd.write('%s %i %s\n' % (commandhash, duration, target))
+        self._fd.flush()
+
+_logs = {}
+
+def getlog(path):
+    """
+    Get the CommandLog for `path`. All the makes running in this process
+    share one CommandLog per file.
+    """
+    path = os.path.normpath(path)
+    log = _logs.get(path)
+    if log is None:
+        log = CommandLog(path)
+        _logs[path] = log
+    return log
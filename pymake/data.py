@@ -2,10 +2,10 @@
 A representation of makefile data structures.
 """
 
-import logging, re, os, sys
+import logging, re, os, sys, time
 from functools import reduce
-import parserdata, parser, functions, process, util, implicit
-import globrelative
+import parserdata, parser, functions, process, util, implicit, commandlog, digests, artifactcache, restatlog
+import globrelative, snapshot
 from pymake import errors
 
 try:
@@ -40,13 +40,98 @@ def mtimeislater(deptime, targettime):
     # int(1000*x) because of http://bugs.python.org/issue10148
     return int(1000 * deptime) > int(1000 * targettime)
 
-def getmtime(path):
+def _statmtime(path):
     try:
-        s = os.stat(path)
-        return s.st_mtime
+        return os.stat(path).st_mtime
     except OSError:
         return None
 
+class StatCache(object):
+    """
+    Remembers the mtime of files, or that they don't exist, keyed by absolute
+    path, and the listings of directories. A single cache is shared by every
+    makefile in this process, including restarted makefiles and in-process
+    submakes.
+
+    Entries, and the listing of their directory, are invalidated when pymake
+    remakes the corresponding target, and the whole cache is dropped whenever
+    a command or $(shell) finishes, since those may touch any file.
+    """
+
+    def __init__(self):
+        self._mtimes = {}
+        self._direntries = {} # dir -> set of lowercased entry names
+        self.lookups = 0
+        self.stats = 0
+
+    def getmtime(self, path):
+        path = os.path.normpath(path)
+        self.lookups += 1
+
+        try:
+            return self._mtimes[path]
+        except KeyError:
+            pass
+
+        self.stats += 1
+        mtime = _statmtime(path)
+        self._mtimes[path] = mtime
+        return mtime
+
+    def prefetch(self, paths, threads):
+        """
+        stat() all of `paths` that aren't already cached, using a pool of
+        `threads` threads. os.stat releases the GIL, so on slow (network)
+        filesystems the latency of many stats overlaps.
+        """
+        paths = [p for p in set([os.path.normpath(p) for p in paths])
+                 if p not in self._mtimes]
+        if not len(paths):
+            return
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(threads)
+        try:
+            results = pool.map(_statmtime, paths, chunksize=64)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.stats += len(paths)
+        self._mtimes.update(zip(paths, results))
+
+    def mayexist(self, path):
+        """
+        Check a directory listing to see whether `path` might exist, without
+        stat()ing it. Entries are compared case-insensitively, so a True
+        result still needs to be confirmed.
+        """
+        dir, file = os.path.split(os.path.normpath(path))
+        entries = self._direntries.get(dir, None)
+        if entries is None:
+            try:
+                entries = set([e.lower() for e in os.listdir(dir or '.')])
+            except OSError:
+                entries = set()
+            self._direntries[dir] = entries
+
+        return file.lower() in entries
+
+    def invalidate(self, path):
+        path = os.path.normpath(path)
+        self._mtimes.pop(path, None)
+        self._direntries.pop(os.path.dirname(path), None)
+
+    def clear(self):
+        self._mtimes.clear()
+        self._direntries.clear()
+
+statcache = StatCache()
+
+def getmtime(path):
+    assert os.path.isabs(path)
+    return statcache.getmtime(path)
+
 def stripdotslash(s):
     if s.startswith('./'):
         st = s[2:]
@@ -60,6 +145,66 @@ def stripdotslashes(sl):
 def getindent(stack):
     return ''.ljust(len(stack) - 1)
 
+class TargetStack(object):
+    """
+    An immutable stack of the targets being resolved or made, used to detect
+    dependency cycles. push() shares the rest of the stack with the new one,
+    so deep dependency chains don't copy the stack at every level.
+
+    Targets on the stack are also kept in a dict mapping them to their depth,
+    so membership tests don't walk the stack. The first stack pushed onto a
+    given stack takes over its dict, and later ones copy it. Entries deeper
+    than a stack belong to some other branch and are ignored.
+    """
+
+    __slots__ = ('target', 'parent', 'depth', '_onpath', '_extended')
+
+    def __init__(self, target=None, parent=None):
+        self.target = target
+        self.parent = parent
+        self._extended = False
+
+        if parent is None:
+            self.depth = 0
+            self._onpath = {}
+            if target is not None:
+                self.depth = 1
+                self._onpath[target] = 1
+            return
+
+        assert target not in parent, "Target %r is already on the stack" % (target,)
+
+        self.depth = parent.depth + 1
+        if parent._extended:
+            self._onpath = dict((t, d) for t, d in parent._onpath.items()
+                                if d <= parent.depth)
+        else:
+            parent._extended = True
+            self._onpath = parent._onpath
+        self._onpath[target] = self.depth
+
+    def push(self, target):
+        return TargetStack(target, self)
+
+    def __contains__(self, target):
+        d = self._onpath.get(target)
+        return d is not None and d <= self.depth
+
+    def __len__(self):
+        return self.depth
+
+    def __iter__(self):
+        l = []
+        s = self
+        while s is not None and s.target is not None:
+            l.append(s.target)
+            s = s.parent
+        l.reverse()
+        return iter(l)
+
+    def __repr__(self):
+        return repr(list(self))
+
 def _if_else(c, t, f):
     if c:
         return t()
@@ -543,6 +688,15 @@ class Variables(object):
         for k, flavor, source, value in other:
             self.set(k, flavor, source, value)
 
+    def copy(self, parent=None):
+        """
+        Return a copy of these variables with a different parent. Values are
+        never changed in place, so they are shared.
+        """
+        v = Variables(parent)
+        v._map = self._map.copy()
+        return v
+
     def __iter__(self):
         for k, (flavor, source, value, valueexp) in self._map.items():
             yield k, flavor, source, value
@@ -934,32 +1088,248 @@ class RemakeRuleContext(object):
                     _log.info("%sRemaking %s using rule at %s because there are no prerequisites listed for a double-colon rule.", indent, self.target.target, self.rule.loc)
                     remake = True
 
+        digestdb = self.makefile.digestdb
+        built = None
+        if digestdb is not None:
+            built = digestdb.getbuilt(self._fspath(self.target))
+
         if not remake:
             for d, weak in self.deps:
-                if mtimeislater(d.mtime, self.target.mtime):
+                if self._isnewer(d, built):
                     _log.info("%sRemaking %s using rule at %s because %s is newer.", indent, self.target.target, self.rule.loc, d.target)
                     remake = True
                     break
 
+        log = self.makefile.commandlog
+        if log is not None:
+            # Logs are shared by submakes in other directories, so key them
+            # by path.
+            logkey = self._fspath(self.target)
+            if self.rule.doublecolon:
+                logkey += '::%i' % self.target.rules.index(self.rule)
+
+            try:
+                commandhash = commandlog.hashcommands(self.rule.getcommandsignature(self.target, self.makefile))
+            except errors.MakeError as e:
+                print(e)
+                sys.stdout.flush()
+                cb(error=True)
+                return
+
+        if not remake and log is not None:
+            oldhash = log.gethash(logkey)
+            if oldhash is None:
+                if not self.makefile.justprint:
+                    log.record(logkey, commandhash, 0)
+            elif oldhash != commandhash:
+                _log.info("%sRemaking %s using rule at %s because its commands have changed.", indent, self.target.target, self.rule.loc)
+                remake = True
+
         if remake:
             self.target.beingremade()
             self.target.didanything = True
+
+            self.restat = None
+            if self.target.mtime is not None and not self.makefile.justprint and self.target.isrestat(self.makefile):
+                path = self._fspath(self.target)
+                try:
+                    self.restat = (path, os.stat(path).st_mtime, self._getdigest(path))
+                except (OSError, IOError):
+                    pass
+
             try:
-                self.commands = [c for c in self.rule.getcommands(self.target, self.makefile)]
+                commands = [c for c in self.rule.getcommands(self.target, self.makefile)]
             except errors.MakeError as e:
                 print(e)
                 sys.stdout.flush()
                 cb(error=True)
                 return
 
+            self.commands = commands
+            cache = self.makefile.artifactcache
+            self.depfile = None
+            if (self.makefile.depslog is not None or cache is not None) and not self.makefile.justprint:
+                try:
+                    self.depfile = self.rule.getdepfile(self.target, self.makefile)
+                except errors.MakeError as e:
+                    print(e)
+                    sys.stdout.flush()
+                    cb(error=True)
+                    return
+
+            self.cachekey = None
+            if cache is not None and len(commands) and not self.makefile.justprint and not self.target.isphony(self.makefile):
+                outputs = self._outputs()
+                key = self._cachekey(commands)
+                if cache.get(key, outputs):
+                    _log.info("%sRestored %s from the artifact cache instead of running the commands at %s.", indent, self.target.target, self.rule.loc)
+                    for path in outputs:
+                        statcache.invalidate(path)
+                    self.commands = []
+                else:
+                    self.cachekey = key
+
+            if (log is not None or digestdb is not None or self.restat is not None or self.depfile is not None or self.cachekey is not None) and not self.makefile.justprint:
+                self.starttime = time.time()
+                self.logentry = log is not None and (logkey, commandhash) or None
+                self.usercb = cb
+                self.runcb = self._remadecb
+
             self._commandcb(False)
         else:
+            if digestdb is not None and not self.makefile.justprint:
+                digests = self._depdigests()
+                if built is None or util.any((p not in built for p in digests)):
+                    digestdb.setbuilt(self._fspath(self.target), digests)
             cb(error=False)
 
+    def _remadecb(self, error):
+        if not error:
+            if self.logentry is not None:
+                logkey, commandhash = self.logentry
+                self.makefile.commandlog.record(logkey, commandhash, time.time() - self.starttime)
+            if self.makefile.digestdb is not None:
+                self.makefile.digestdb.setbuilt(self._fspath(self.target), self._depdigests())
+            if self.restat is not None:
+                self._restat()
+            if self.depfile is not None and self.makefile.depslog is not None:
+                self._logdepfile()
+            if self.cachekey is not None:
+                self._cacheoutputs()
+        self.usercb(error=error)
+
+    def _outputs(self):
+        """
+        The files made by the commands: the target, and its .DEPFILE if any.
+        """
+        outputs = [self._fspath(self.target)]
+        if self.depfile is not None:
+            outputs.append(util.normaljoin(self.makefile.workdir, self.depfile))
+        return outputs
+
+    def _cachekey(self, commands):
+        prerequisites = []
+        for d, weak in self.deps:
+            digest = None
+            if d.mtime is not None:
+                try:
+                    digest = self._getdigest(self._fspath(d))
+                except (OSError, IOError):
+                    pass
+            prerequisites.append((d.target, digest))
+
+        # MAKEFLAGS differs between otherwise identical builds, such as
+        # with -j, and commands which use it aren't worth caching anyway
+        env = commands[0].kwargs['env']
+        environment = sorted([(name, env.get(name))
+                              for name, exported in self.makefile.exportedvars.items()
+                              if exported and name != 'MAKEFLAGS'])
+
+        return artifactcache.getkey(self.target.target, commands, prerequisites, environment)
+
+    def _cacheoutputs(self):
+        outputs = self._outputs()
+        for path in outputs:
+            if not os.path.isfile(path):
+                return
+        self.makefile.artifactcache.put(self.cachekey, outputs)
+
+    def _logdepfile(self):
+        """
+        Read the dependency file which the commands wrote into the deps log.
+        """
+        path = util.normaljoin(self.makefile.workdir, self.depfile)
+        try:
+            mtime = os.stat(path).st_mtime
+            stmts = parser.parsedepfile(path)
+        except (OSError, IOError, ValueError) as e:
+            _log.warning("Could not read dependency file %s for %s: %s", self.depfile, self.target.target, e)
+            return
+
+        # The log is shared by submakes in other directories, so it records
+        # paths. See Makefile.applydepslog.
+        workdir = self.makefile.workdir
+        targets = []
+        deps = {}
+        for s in stmts:
+            prereqs = [util.normaljoin(workdir, p)
+                       for p in stripdotslashes(s.depexp.resolvesplit(self.makefile, self.makefile.variables))]
+            if not prereqs:
+                continue
+            for t in stripdotslashes(s.targetexp.resolvesplit(self.makefile, self.makefile.variables)):
+                t = util.normaljoin(workdir, t)
+                if t not in deps:
+                    targets.append(t)
+                    deps[t] = []
+                deps[t].extend(prereqs)
+
+        statcache.invalidate(path)
+        self.makefile.depslog.record(path, mtime, [(t, deps[t]) for t in targets])
+
+    def _getdigest(self, path):
+        if self.makefile.digestdb is not None:
+            return self.makefile.digestdb.getdigest(path)
+        return digests.hashfile(path)
+
+    def _restat(self):
+        """
+        If the commands rewrote the target without changing its contents,
+        treat it as not remade. Its new mtime is left on disk, so that it
+        stays newer than its prerequisites, and the restat log records when
+        its contents last changed, for its dependents to compare against in
+        this make and later ones.
+        """
+        path, oldmtime, olddigest = self.restat
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime != oldmtime and self._getdigest(path) != olddigest:
+                return
+        except (OSError, IOError):
+            return
+
+        if mtime != oldmtime:
+            restatlog.record(path, mtime, restatlog.getchangedmtime(path, oldmtime))
+            self.target.mtime = mtime
+        self.target.wasremade = False
+        _log.info("%s was not changed by its commands, so its dependents aren't remade.", self.target.target)
+
+    def _fspath(self, t):
+        return util.normaljoin(self.makefile.workdir, t.vpathtarget)
+
+    def _depdigests(self):
+        """
+        The current digests of the prerequisites which are files, by path.
+        """
+        digests = {}
+        for d, weak in self.deps:
+            if d.mtime is None:
+                continue
+            path = self._fspath(d)
+            digest = self.makefile.digestdb.getdigest(path)
+            if digest is not None:
+                digests[path] = digest
+        return digests
+
+    def _isnewer(self, d, built):
+        """
+        Is the prerequisite `d` newer than the target? If the digests of the
+        prerequisites were recorded when the target was last made, compare
+        the contents of `d` instead of its mtime.
+        """
+        if built is not None and d.mtime is not None:
+            path = self._fspath(d)
+            digest = built.get(path)
+            if digest is not None:
+                return self.makefile.digestdb.getdigest(path) != digest
+        return mtimeislater(d.getchangedmtime(self.makefile), self.target.mtime)
+
 MAKESTATE_NONE = 0
 MAKESTATE_FINISHED = 1
 MAKESTATE_WORKING = 2
 
+# shared by all targets which have no rules
+_norules = ()
+
 class Target(object):
     """
     An actual (non-pattern) target.
@@ -969,19 +1339,68 @@ class Target(object):
 
     The rules associated with this target may be Rule instances or, in the case of static pattern
     rules, PatternRule instances.
+
+    Most targets are only ever mentioned as prerequisites, so they are kept small: target-specific
+    variables are only allocated when first needed, and targets without rules share an empty
+    rule list.
     """
 
-    wasremade = False
+    __slots__ = ('target', 'vpathtarget', 'rules', 'explicit', 'mtime', 'wasremade',
+                 'error', 'didanything', '_state', '_callbacks', '_variables', '_parentvariables')
 
     def __init__(self, target, makefile):
         assert isinstance(target, str_type)
         self.target = target
         self.vpathtarget = None
-        self.rules = []
-        self.variables = Variables(makefile.variables)
+        self.rules = _norules
+        self._variables = None
+        self._parentvariables = makefile.variables
         self.explicit = False
+        self.wasremade = False
         self._state = MAKESTATE_NONE
 
+    @property
+    def variables(self):
+        """
+        Target-specific variables. Accessing this allocates them, so code which
+        only reads variables should use getvariables().
+        """
+        if self._variables is None:
+            self._variables = Variables(self._parentvariables)
+        return self._variables
+
+    def getvariables(self):
+        """
+        Return the variables in effect for this target, without allocating
+        target-specific variables if there aren't any.
+        """
+        if self._variables is None:
+            return self._parentvariables
+        return self._variables
+
+    def copy(self, makefile):
+        """
+        Return a copy of this target for a copy of its makefile, which is
+        still being parsed. Rules are not changed once they have been added,
+        so they are shared.
+        """
+        assert self._state == MAKESTATE_NONE
+        t = Target.__new__(Target)
+        t.target = self.target
+        t.vpathtarget = self.vpathtarget
+        t.rules = self.rules is _norules and _norules or list(self.rules)
+        t.explicit = self.explicit
+        t.wasremade = self.wasremade
+        t._state = self._state
+        t._parentvariables = makefile.variables
+        t._variables = self._variables is not None and self._variables.copy(makefile.variables) or None
+        return t
+
+    def _appendrule(self, rule):
+        if self.rules is _norules:
+            self.rules = []
+        self.rules.append(rule)
+
     def addrule(self, rule):
         assert isinstance(rule, (Rule, PatternRuleInstance))
         if len(self.rules) and rule.doublecolon != self.rules[0].doublecolon:
@@ -993,7 +1412,7 @@ class Target(object):
             if rule.prule.targetpatterns[0].match(self.target) is None:
                 raise errors.DataError("Static pattern rule doesn't match target '%s'" % self.target, rule.loc)
 
-        self.rules.append(rule)
+        self._appendrule(rule)
 
     def isdoublecolon(self):
         return self.rules[0].doublecolon
@@ -1002,6 +1421,28 @@ class Target(object):
         """Is this a phony target? We don't check for existence of phony targets."""
         return makefile.gettarget('.PHONY').hasdependency(self.target)
 
+    def isrestat(self, makefile):
+        """
+        Is this a .RESTAT target? If remaking it leaves its contents unchanged,
+        its dependents see it as not remade, in this make and later ones. See
+        getchangedmtime. A .RESTAT rule without
+        prerequisites applies to every target.
+        """
+        if not makefile.hastarget('.RESTAT'):
+            return False
+        restat = makefile.gettarget('.RESTAT')
+        return restat.hasdependency(self.target) or not util.any((len(r.prerequisites) for r in restat.rules))
+
+    def getchangedmtime(self, makefile):
+        """
+        The mtime which dependents compare against. For a .RESTAT target whose
+        commands rewrote it without changing its contents, this is when its
+        contents last changed, which is earlier than its mtime.
+        """
+        if self.mtime is None or not makefile.hastarget('.RESTAT'):
+            return self.mtime
+        return restatlog.getchangedmtime(util.normaljoin(makefile.workdir, self.vpathtarget), self.mtime)
+
     def hasdependency(self, t):
         for rule in self.rules:
             if t in rule.prerequisites:
@@ -1013,20 +1454,29 @@ class Target(object):
         """
         Try to resolve an implicit rule to build this target.
         """
+        makefile.runresolution(self._resolveimplicitruletask(makefile, targetstack, rulestack))
+
+    def _resolveimplicitruletask(self, makefile, targetstack, rulestack):
+        """
+        A resolution task (see Makefile.runresolution) which does the work of
+        resolveimplicitrule.
+        """
         # The steps in the GNU make manual Implicit-Rule-Search.html are very detailed. I hope they can be trusted.
 
         indent = getindent(targetstack)
 
         _log.info("%sSearching for implicit rule to make '%s'", indent, self.target)
 
+        starttime = time.time()
+
         dir, s, file = util.strrpartition(self.target, '/')
         dir = dir + s
 
         candidates = [] # list of PatternRuleInstance
 
-        hasmatch = util.any((r.hasspecificmatch(file) for r in makefile.implicitrules))
+        hasmatch, matches = makefile.getimplicitruleindex().matches(self.target, file)
 
-        for r in makefile.implicitrules:
+        for r, patterns in matches:
             if r in rulestack:
                 _log.info("%s %s: Avoiding implicit rule recursion", indent, r.loc)
                 continue
@@ -1034,9 +1484,11 @@ class Target(object):
             if not len(r.commands):
                 continue
 
-            for ri in r.matchesfor(dir, file, hasmatch):
+            for ri in r.matchesfor(dir, file, hasmatch, patterns):
                 candidates.append(ri)
-            
+
+        makefile.resolvetimes['rulesearch'] += time.time() - starttime
+
         newcandidates = []
 
         for r in candidates:
@@ -1056,20 +1508,32 @@ class Target(object):
                 continue
 
             _log.info("%sFound implicit rule at %s for target '%s'", indent, r.loc, self.target)
-            self.rules.append(r)
+            self._appendrule(r)
             return
 
         # Try again, but this time with chaining and without terminal (double-colon) rules
 
         for r in newcandidates:
             newrulestack = rulestack + [r.prule]
+            stackkey = tuple(newrulestack)
 
             depfailed = None
             for p in r.prerequisites:
+                failurekey = (p, stackkey)
+                if failurekey in makefile.implicitfailures:
+                    _log.info("%s Prerequisite '%s' is already known not to be makeable with this rule chain.", indent, p)
+                    depfailed = p
+                    break
+
                 t = makefile.gettarget(p)
+                cycles = makefile.dependencycycles
                 try:
-                    t.resolvedeps(makefile, targetstack, newrulestack, True)
+                    yield t._resolvedepstask(makefile, targetstack, newrulestack, True)
                 except errors.ResolutionError:
+                    # A failure caused by a dependency cycle depends on
+                    # targetstack, so it may not happen on another path.
+                    if makefile.dependencycycles == cycles:
+                        makefile.implicitfailures.add(failurekey)
                     depfailed = p
                     break
 
@@ -1078,7 +1542,7 @@ class Target(object):
                 continue
 
             _log.info("%sFound implicit rule at %s for target '%s'", indent, r.loc, self.target)
-            self.rules.append(r)
+            self._appendrule(r)
             return
 
         _log.info("%sCouldn't find implicit rule to remake '%s'", indent, self.target)
@@ -1103,19 +1567,31 @@ class Target(object):
         @param rulestack is the current stack of implicit rules being used to resolve
                dependencies. A rule chain cannot use the same implicit rule twice.
         """
+        makefile.runresolution(self._resolvedepstask(makefile, targetstack, rulestack, recursive))
+
+    def _resolvedepstask(self, makefile, targetstack, rulestack, recursive):
+        """
+        A resolution task (see Makefile.runresolution) which does the work of
+        resolvedeps.
+        """
         assert makefile.parsingfinished
 
         if self.target in targetstack:
+            makefile.dependencycycles += 1
             raise errors.ResolutionError("Recursive dependency: %s -> %s" % (
                     " -> ".join(targetstack), self.target))
 
-        targetstack = targetstack + [self.target]
-        
+        targetstack = targetstack.push(self.target)
+
         indent = getindent(targetstack)
 
         _log.info("%sConsidering target '%s'", indent, self.target)
 
+        makefile.includelazydeps(self.target)
+
+        starttime = time.time()
         self.resolvevpath(makefile)
+        makefile.resolvetimes['vpath'] += time.time() - starttime
 
         # Sanity-check our rules. If we're single-colon, only one rule should have commands
         ruleswithcommands = self.ruleswithcommands()
@@ -1126,7 +1602,7 @@ class Target(object):
                 raise errors.DataError("Target '%s' has multiple rules with commands." % self.target)
 
         if ruleswithcommands == 0:
-            self.resolveimplicitrule(makefile, targetstack, rulestack)
+            yield self._resolveimplicitruletask(makefile, targetstack, rulestack)
 
         # If a target is mentioned, but doesn't exist, has no commands and no
         # prerequisites, it is special and exists just to say that targets which
@@ -1146,10 +1622,12 @@ class Target(object):
                     if dt.explicit:
                         continue
 
-                    dt.resolvedeps(makefile, targetstack, newrulestack, True)
+                    yield dt._resolvedepstask(makefile, targetstack, newrulestack, True)
 
+        starttime = time.time()
         for v in makefile.getpatternvariablesfor(self.target):
             self.variables.merge(v)
+        makefile.resolvetimes['variables'] += time.time() - starttime
 
     def resolvevpath(self, makefile):
         if self.vpathtarget is not None:
@@ -1162,31 +1640,29 @@ class Target(object):
 
         if self.target.startswith('-l'):
             stem = self.target[2:]
-            f, s, e = makefile.variables.get('.LIBPATTERNS')
-            if e is not None:
-                libpatterns = [Pattern(stripdotslash(s)) for s in e.resolvesplit(makefile, makefile.variables)]
-                if len(libpatterns):
-                    searchdirs = ['']
-                    searchdirs.extend(makefile.getvpath(self.target))
-
-                    for lp in libpatterns:
-                        if not lp.ispattern():
-                            raise errors.DataError('.LIBPATTERNS contains a non-pattern')
-
-                        libname = lp.resolve('', stem)
-
-                        for dir in searchdirs:
-                            libpath = util.normaljoin(dir, libname).replace('\\', '/')
-                            fspath = util.normaljoin(makefile.workdir, libpath)
-                            mtime = getmtime(fspath)
-                            if mtime is not None:
-                                self.vpathtarget = libpath
-                                self.mtime = mtime
-                                return
-
-                    self.vpathtarget = self.target
-                    self.mtime = None
-                    return
+            libpatterns = makefile.getlibpatterns()
+            if len(libpatterns):
+                searchdirs = ['']
+                searchdirs.extend(makefile.getvpath(self.target))
+
+                for lp in libpatterns:
+                    libname = lp.resolve('', stem)
+
+                    for dir in searchdirs:
+                        libpath = util.normaljoin(dir, libname).replace('\\', '/')
+                        fspath = util.normaljoin(makefile.workdir, libpath)
+                        if not statcache.mayexist(fspath):
+                            continue
+
+                        mtime = getmtime(fspath)
+                        if mtime is not None:
+                            self.vpathtarget = libpath
+                            self.mtime = mtime
+                            return
+
+                self.vpathtarget = self.target
+                self.mtime = None
+                return
 
         search = [self.target]
         if not os.path.isabs(self.target):
@@ -1227,6 +1703,10 @@ class Target(object):
         assert self._state == MAKESTATE_WORKING, "State was %s" % self._state
         # If we were remade then resolve mtime again
         if self.wasremade:
+            fspath = util.normaljoin(makefile.workdir, self.target)
+            statcache.invalidate(fspath)
+            util.invalidaterealpath(fspath)
+            makefile.implicitfailures.clear()
             targetandtime = self.searchinlocs(makefile, [self.target])
             if targetandtime is not None:
                 (_, self.mtime) = targetandtime
@@ -1292,6 +1772,8 @@ class Target(object):
             self.notifydone(makefile)
             return
 
+        targetstack = targetstack.push(self.target)
+
         if self.isdoublecolon():
             rulelist = [RemakeRuleContext(self, makefile, r, [(makefile.gettarget(p), False) for p in r.prerequisites], targetstack, avoidremakeloop) for r in self.rules]
         else:
@@ -1311,8 +1793,6 @@ class Target(object):
 
             rulelist = [RemakeRuleContext(self, makefile, commandrule, alldeps, targetstack, avoidremakeloop)]
 
-        targetstack = targetstack + [self.target]
-
         if serial:
             RemakeTargetSerially(self, makefile, indent, rulelist)
         else:
@@ -1338,7 +1818,7 @@ def setautomaticvariables(v, makefile, target, prerequisites):
     prtargets = [makefile.gettarget(p) for p in prerequisites]
     prall = [pt.vpathtarget for pt in prtargets]
     proutofdate = [pt.vpathtarget for pt in withoutdups(prtargets)
-                   if target.mtime is None or mtimeislater(pt.mtime, target.mtime)]
+                   if target.mtime is None or mtimeislater(pt.getchangedmtime(makefile), target.mtime)]
     
     setautomatic(v, '@', [target.vpathtarget])
     if len(prall):
@@ -1393,6 +1873,11 @@ class _CommandWrapper(object):
         self.context = context
 
     def _cb(self, res):
+        # The command may have created, modified or removed any file or
+        # symlink.
+        statcache.clear()
+        util.invalidaterealpath()
+
         if res != 0 and not self.ignoreErrors:
             print("%s: command '%s' failed, return code %i" % (self.loc, self.cline, res))
             self.usercb(error=True)
@@ -1429,11 +1914,90 @@ class _NativeWrapper(_CommandWrapper):
                             loc=self.loc, cb=self._cb, context=self.context,
                             pycommandpath=self.pycommandpath, **self.kwargs)
 
-def getcommandsforrule(rule, target, makefile, prerequisites, stem):
-    v = Variables(parent=target.variables)
+def getrulevariables(target, makefile, prerequisites, stem):
+    """
+    The variables of `target`, with the automatic variables set.
+    """
+    v = Variables(parent=target.getvariables())
     setautomaticvariables(v, makefile, target, prerequisites)
     if stem is not None:
         setautomatic(v, '*', [stem])
+    return v
+
+def getdepfileforrule(target, makefile, prerequisites, stem):
+    """
+    Expand .DEPFILE for `target`: the dependency file its commands write,
+    if any.
+    """
+    v = getrulevariables(target, makefile, prerequisites, stem)
+    flavor, source, value = v.get('.DEPFILE', True)
+    if value is None:
+        return None
+    return value.resolvestr(makefile, v, ['.DEPFILE']).strip() or None
+
+def _functionsin(e):
+    """
+    All the functions (including variable references) in the expansion `e`,
+    however deeply nested.
+    """
+    if isinstance(e, Expansion):
+        for f, isfunc in e:
+            if isfunc:
+                yield f
+                for arg in f.expansions():
+                    for nested in _functionsin(arg):
+                        yield nested
+
+def getcommandsignatureforrule(rule, target, makefile, prerequisites, stem):
+    """
+    Describe the commands of `rule` for `target` without expanding them, so
+    that checking whether they changed has no side effects: their source,
+    and the values of the variables they reference, recursively. The value
+    of $? is left out, because it only says why the target is remade.
+    Returns a list of strings.
+    """
+    v = getrulevariables(target, makefile, prerequisites, stem)
+
+    signature = []
+    seen = set(['?', '?D', '?F'])
+    pending = list(reversed(rule.commands))
+    while len(pending):
+        e = pending.pop()
+        signature.append(e.to_source())
+
+        names = []
+        for f in _functionsin(e):
+            if isinstance(f, (functions.VariableRef, functions.SubstitutionRef)):
+                vname = f.vname
+            elif isinstance(f, (functions.CallFunction, functions.ValueFunction,
+                                functions.OriginFunction, functions.FlavorFunction)):
+                vname = f[0]
+            else:
+                continue
+
+            if isinstance(vname, StringExpansion):
+                names.append(vname.s)
+            else:
+                # A computed name: only the name itself is expanded.
+                names.append(vname.resolvestr(makefile, v).strip())
+
+        for name in names:
+            if name in seen:
+                continue
+            seen.add(name)
+
+            flavor, source, value = v.get(name, expand=False)
+            signature.append('%s=%r:%s' % (name, flavor, value))
+            if flavor is not None and flavor != Variables.FLAVOR_SIMPLE:
+                pending.append(v.get(name)[2])
+
+    return signature
+
+def getcommandsforrule(rule, target, makefile, prerequisites, stem):
+    """
+    Expand the commands of `rule` for `target`.
+    """
+    v = getrulevariables(target, makefile, prerequisites, stem)
 
     env = makefile.getsubenvironment(v)
 
@@ -1464,6 +2028,8 @@ class Rule(object):
     contain rule-specific variables. This rule may be associated with multiple targets.
     """
 
+    __slots__ = ('prerequisites', 'doublecolon', 'commands', 'loc', 'weakdeps')
+
     def __init__(self, prereqs, doublecolon, loc, weakdeps):
         self.prerequisites = prereqs
         self.doublecolon = doublecolon
@@ -1475,8 +2041,7 @@ class Rule(object):
         assert isinstance(c, (Expansion, StringExpansion))
         self.commands.append(c)
 
-    def getcommands(self, target, makefile):
-        assert isinstance(target, Target)
+    def _getprerequisites(self, target):
         # Prerequisites are merged if the target contains multiple rules and is
         # not a terminal (double colon) rule. See
         # https://www.gnu.org/software/make/manual/make.html#Multiple-Targets.
@@ -1490,9 +2055,21 @@ class Rule(object):
                 if rule != self:
                     prereqs.extend(rule.prerequisites)
 
-        return getcommandsforrule(self, target, makefile, prereqs, stem=None)
+        return prereqs
+
+    def getcommands(self, target, makefile):
+        assert isinstance(target, Target)
+        return getcommandsforrule(self, target, makefile, self._getprerequisites(target), stem=None)
         # TODO: $* in non-pattern rules?
 
+    def getcommandsignature(self, target, makefile):
+        assert isinstance(target, Target)
+        return getcommandsignatureforrule(self, target, makefile, self._getprerequisites(target), stem=None)
+
+    def getdepfile(self, target, makefile):
+        assert isinstance(target, Target)
+        return getdepfileforrule(target, makefile, self._getprerequisites(target), stem=None)
+
 class PatternRuleInstance(object):
     weakdeps = False
 
@@ -1516,6 +2093,14 @@ class PatternRuleInstance(object):
         assert isinstance(target, Target)
         return getcommandsforrule(self, target, makefile, self.prerequisites, stem=self.dir + self.stem)
 
+    def getcommandsignature(self, target, makefile):
+        assert isinstance(target, Target)
+        return getcommandsignatureforrule(self, target, makefile, self.prerequisites, stem=self.dir + self.stem)
+
+    def getdepfile(self, target, makefile):
+        assert isinstance(target, Target)
+        return getdepfileforrule(target, makefile, self.prerequisites, stem=self.dir + self.stem)
+
     def __str__(self):
         return "Pattern rule at %s with stem '%s', matchany: %s doublecolon: %s" % (self.loc,
                                                                                     self.dir + self.stem,
@@ -1549,13 +2134,17 @@ class PatternRule(object):
 
         return False
 
-    def matchesfor(self, dir, file, skipsinglecolonmatchany):
+    def matchesfor(self, dir, file, skipsinglecolonmatchany, patterns=None):
         """
         Determine all the target patterns of this rule that might match target t.
+        @param patterns if not None, only these target patterns (in order) are tried
         @yields a PatternRuleInstance for each.
         """
 
-        for p in self.targetpatterns:
+        if patterns is None:
+            patterns = self.targetpatterns
+
+        for p in patterns:
             matchany = p.ismatchany()
             if matchany:
                 if skipsinglecolonmatchany and not self.doublecolon:
@@ -1574,15 +2163,149 @@ class PatternRule(object):
     def prerequisitesforstem(self, dir, stem):
         return [p.resolve(dir, stem) for p in self.prerequisites]
 
+class PatternIndex(object):
+    """
+    An ordered collection of (Pattern, value) pairs which can quickly find
+    the patterns that might match a word, without trying every pattern.
+
+    Patterns are bucketed by the literal text before and after the '%'. A word
+    can only match a pattern if it starts with the prefix and ends with the
+    suffix, so a lookup checks one dict per distinct (prefix length, suffix
+    length) pair. Results come back in the order the patterns were added.
+    """
+
+    def __init__(self):
+        self._buckets = {} # (len(prefix), len(suffix)) -> {(prefix, suffix): [(order, pattern, value), ...]}
+        self._lengths = []
+        self._count = 0
+
+    def add(self, pattern, value):
+        if pattern.ispattern():
+            key = pattern.data
+        else:
+            key = (pattern.data[0], '')
+
+        lengths = (len(key[0]), len(key[1]))
+        if lengths not in self._buckets:
+            self._buckets[lengths] = {}
+            self._lengths.append(lengths)
+            self._lengths.sort(key=sum)
+
+        self._buckets[lengths].setdefault(key, []).append((self._count, pattern, value))
+        self._count += 1
+
+    def copy(self, valuemap=None):
+        """
+        Return a copy of the index. If `valuemap` is given, values are replaced
+        by valuemap[value].
+        """
+        entries = []
+        for bucket in self._buckets.values():
+            for l in bucket.values():
+                entries.extend(l)
+        entries.sort()
+
+        index = PatternIndex()
+        for order, pattern, value in entries:
+            if valuemap is not None:
+                value = valuemap[value]
+            index.add(pattern, value)
+        return index
+
+    def candidates(self, word):
+        """
+        @returns a list of (order, pattern, value) for patterns whose prefix
+                 and suffix match `word`. Non-patterns must still be checked
+                 for an exact match.
+        """
+        found = []
+        wlen = len(word)
+        for lengths in self._lengths:
+            pl, sl = lengths
+            if pl + sl > wlen:
+                break
+            found.extend(self._buckets[lengths].get((word[:pl], word[wlen - sl:]), ()))
+
+        found.sort()
+        return found
+
+    def match(self, word):
+        """
+        @returns a list of (pattern, value) for patterns which match `word`
+                 with a non-empty stem.
+        """
+        return [(p, v) for order, p, v in self.candidates(word)
+                if p.match(word)]
+
+class ImplicitRuleIndex(object):
+    """
+    An index of the target patterns of a makefile's implicit rules, so that
+    finding the rules which might match a target doesn't scan every rule.
+    """
+
+    def __init__(self, rules):
+        self.index = PatternIndex()
+        for r in rules:
+            for p in r.targetpatterns:
+                self.index.add(p, r)
+
+    def matches(self, target, file):
+        """
+        Find the implicit rules which might match `target`, whose last path
+        component is `file`.
+
+        @returns (hasmatch, [(rule, [pattern, ...]), ...]) in rule order, where
+                 hasmatch is whether any non-match-anything pattern matches
+                 `file`, as PatternRule.hasspecificmatch would report.
+        """
+        hasmatch = False
+        matches = []
+        lastrule = None
+
+        candidates = self.index.candidates(target)
+        if file != target:
+            # Patterns may also match just the last path component.
+            candidates = sorted(set(candidates + self.index.candidates(file)))
+
+        for order, p, r in candidates:
+            if not hasmatch and not p.ismatchany() and p.match(file) is not None:
+                hasmatch = True
+
+            if r is not lastrule:
+                matches.append((r, []))
+                lastrule = r
+            matches[-1][1].append(p)
+
+        return hasmatch, matches
+
 class _RemakeContext(object):
+    """
+    Remake the included makefiles. Makefiles which exist and have no rule
+    which could remake them are skipped. With -j, the rest are all made at
+    once, otherwise one after the other.
+    """
     def __init__(self, makefile, cb):
         self.makefile = makefile
         self.included = [(makefile.gettarget(f), required)
                          for f, required in makefile.included]
-        self.toremake = list(self.included)
+        self.toremake = []
+        for t, required in self.included:
+            if t.mtime is None or makefile.mayhaverule(t.target):
+                self.toremake.append((t, required))
+            else:
+                _log.debug("Not remaking included makefile %s: it exists and no rule could remake it", t.target)
         self.cb = cb
 
-        self.remakecb(error=False, didanything=False)
+        if makefile.context.jcount == 1 or len(self.toremake) < 2:
+            self.remakecb(error=False, didanything=False)
+            return
+
+        self.remaining = len(self.toremake)
+        for target, required in self.toremake:
+            makefile.context.defer(self._startremakeparallel, target)
+
+    def _startremakeparallel(self, target):
+        target.make(self.makefile, TargetStack(), avoidremakeloop=True, cb=self.remakecbparallel, printerror=False)
 
     def remakecb(self, error, didanything):
         assert error in (True, False)
@@ -1597,18 +2320,70 @@ class _RemakeContext(object):
 
         if len(self.toremake):
             target, self.required = self.toremake.pop(0)
-            target.make(self.makefile, [], avoidremakeloop=True, cb=self.remakecb, printerror=False)
+            target.make(self.makefile, TargetStack(), avoidremakeloop=True, cb=self.remakecb, printerror=False)
         else:
-            for t, required in self.included:
-                if t.wasremade:
-                    _log.info("Included file %s was remade, restarting make", t.target)
-                    self.cb(remade=True)
-                    return
-                elif required and t.mtime is None:
-                    self.cb(remade=False, error=errors.DataError("No rule to remake missing include file %s" % t.target))
+            self.finish()
+
+    def remakecbparallel(self, error, didanything):
+        assert error in (True, False)
+
+        self.remaining -= 1
+        if self.remaining:
+            return
+
+        for target, required in self.toremake:
+            if target.error:
+                if required:
+                    self.cb(remade=False, error=errors.MakeError(
+                        'Error remaking required makefiles'))
                     return
+                print('Error remaking makefiles (ignored)')
+
+        self.finish()
+
+    def finish(self):
+        for t, required in self.included:
+            if t.wasremade:
+                _log.info("Included file %s was remade, restarting make", t.target)
+                self.cb(remade=True)
+                return
+            elif required and t.mtime is None:
+                self.cb(remade=False, error=errors.DataError("No rule to remake missing include file %s" % t.target))
+                return
 
-            self.cb(remade=False)
+        self.cb(remade=False)
+
+class Checkpoint(object):
+    """
+    The state of parsing before an include statement: `state` is a copy of
+    the Makefile, and `included` is the number of makefiles which had been
+    included.
+    """
+    __slots__ = ('state', 'frames', 'toplevel', 'included', 'fingerprints', 'globs')
+
+    def __init__(self, state, frames, toplevel, included, fingerprints, globs):
+        self.state = state
+        self.frames = frames
+        self.toplevel = toplevel
+        self.included = included
+        self.fingerprints = fingerprints
+        self.globs = globs
+
+    def checkinputs(self):
+        """
+        Return why parsing can't be resumed from here, or None if it can.
+        """
+        return snapshot.checkinputs(self.fingerprints, self.globs)
+
+    def restore(self, context):
+        """
+        Return a copy of the Makefile as it was, and the frames to pass to
+        parserdata.resumeexecution.
+        """
+        makefile = self.state.copy()
+        makefile.context = context
+        frames = [(stmts, index, c.copy(), including) for stmts, index, c, including in self.frames]
+        return makefile, frames
 
 class Makefile(object):
     """
@@ -1635,15 +2410,60 @@ class Makefile(object):
         self.keepgoing = keepgoing
         self.silent = silent
         self.justprint = justprint
-        self._patternvariables = [] # of (pattern, variables)
+        self._patternvariables = {} # pattern -> variables
+        self._patternvariablesindex = PatternIndex()
         self.implicitrules = []
+        self._implicitruleindex = None
+
+        # (prerequisite, rule stack) pairs which implicit rule chaining could
+        # not make. Only valid until some target is remade.
+        self.implicitfailures = set()
+        self.dependencycycles = 0
+
+        # seconds spent in each phase of dependency resolution
+        self.resolvetimes = {'total': 0.0, 'vpath': 0.0, 'rulesearch': 0.0, 'variables': 0.0}
         self.parsingfinished = False
 
         self._patternvpaths = [] # of (pattern, [dir, ...])
+        self._vpathtable = None # (PatternIndex, {matching indexes: dirs}), see getvpath
+        self._libpatterns = None # expanded .LIBPATTERNS, once parsing is finished
+
+        # Files and (dir, pattern) globs read while parsing, and why parsing
+        # can't be skipped by loading a snapshot, if it can't. See pymake.snapshot.
+        self.parsinginputs = set()
+        self.parsingglobs = set()
+        self.snapshotoptout = None
+
+        # The commandlog.CommandLog used to remake targets whose commands
+        # have changed, the digests.DigestDatabase used to compare
+        # prerequisites by content, and the depslog.DepsLog which records
+        # the contents of dependency files, and the artifactcache.Backend
+        # which stores the outputs of commands, if any
+        self.commandlog = None
+        self.digestdb = None
+        self.depslog = None
+        self.artifactcache = None
+
+        # Dependency files included with includedeps whose rules haven't been
+        # added yet: target -> [path, ...] and path -> ([target, ...], lines).
+        # See includefile().
+        self._lazydepfiles = {}
+        self._lazydeptargets = {}
+
+        # The statement lists being executed, innermost last, as
+        # [statements, index, context, including], or None for an $(eval).
+        # The checkpoints taken before includes, if they are being taken,
+        # the index of the command-line makefile being included, and the
+        # size the makefile must reach before the next checkpoint. See
+        # checkpoint().
+        self.parsestack = []
+        self.checkpoints = None
+        self._toplevel = 0
+        self._checkpointsize = 0
 
         if workdir is None:
             workdir = os.getcwd()
-        workdir = os.path.realpath(workdir)
+        workdir = util.realpath(workdir)
         self.workdir = workdir
         self.variables.set('CURDIR', Variables.FLAVOR_SIMPLE,
                            Variables.SOURCE_AUTOMATIC, workdir.replace('\\','/'))
@@ -1699,18 +2519,16 @@ class Makefile(object):
     def getpatternvariables(self, pattern):
         assert isinstance(pattern, Pattern)
 
-        for p, v in self._patternvariables:
-            if p == pattern:
-                return v
-
-        v = Variables()
-        self._patternvariables.append( (pattern, v) )
+        v = self._patternvariables.get(pattern, None)
+        if v is None:
+            v = Variables()
+            self._patternvariables[pattern] = v
+            self._patternvariablesindex.add(pattern, v)
         return v
 
     def getpatternvariablesfor(self, target):
-        for p, v in self._patternvariables:
-            if p.match(target):
-                yield v
+        for p, v in self._patternvariablesindex.match(target):
+            yield v
 
     def hastarget(self, target):
         return target in self._targets
@@ -1735,6 +2553,118 @@ class Makefile(object):
         assert isinstance(rule, PatternRule)
         self.implicitrules.append(rule)
 
+    def getimplicitruleindex(self):
+        assert self.parsingfinished
+
+        if self._implicitruleindex is None:
+            self._implicitruleindex = ImplicitRuleIndex(self.implicitrules)
+        return self._implicitruleindex
+
+    def runresolution(self, task):
+        """
+        Run a dependency resolution task to completion. A task is a generator
+        which yields the subtasks it depends on. Subtasks are run from an
+        explicit stack rather than by recursion, so that deep dependency chains
+        don't exhaust the Python stack. If a subtask raises, the exception is
+        thrown into the task which yielded it.
+        """
+        starttime = time.time()
+
+        stack = [task]
+        error = None
+        try:
+            while True:
+                task = stack[-1]
+                try:
+                    if error is None:
+                        subtask = next(task)
+                    else:
+                        e, error = error, None
+                        subtask = task.throw(*e)
+                except StopIteration:
+                    stack.pop()
+                    if not len(stack):
+                        return
+                    continue
+                except Exception:
+                    stack.pop()
+                    if not len(stack):
+                        raise
+                    error = sys.exc_info()
+                    continue
+
+                stack.append(subtask)
+        finally:
+            self.resolvetimes['total'] += time.time() - starttime
+
+    def addparsinginputs(self, paths):
+        """
+        Record files whose contents affected parsing.
+        """
+        if not self.parsingfinished:
+            self.parsinginputs.update((os.path.normpath(p) for p in paths))
+
+    def addparsingglobs(self, globs):
+        """
+        Record (dir, pattern) globs, as collected by globrelative.glob, whose
+        results affected parsing.
+        """
+        if not self.parsingfinished:
+            self.parsingglobs.update(globs)
+
+    def optoutofsnapshot(self, reason):
+        """
+        Record that parsing had side effects, or depended on something other
+        than files, so it must be repeated on every run.
+        """
+        if not self.parsingfinished and self.snapshotoptout is None:
+            _log.info("Makefiles cannot be snapshotted: %s", reason)
+            self.snapshotoptout = reason
+
+    def __getstate__(self):
+        # The execution context is per-process; see pymake.snapshot
+        d = dict(self.__dict__)
+        d['context'] = None
+        d['commandlog'] = None
+        d['digestdb'] = None
+        d['depslog'] = None
+        d['artifactcache'] = None
+        d['parsestack'] = []
+        d['checkpoints'] = None
+        return d
+
+    def copy(self):
+        """
+        Return a copy of the makefile as parsed so far, which can go on being
+        parsed separately, for checkpoint(). Rules, pattern rules and variable
+        values are never changed once they have been added, so they are
+        shared; the containers which hold them are copied.
+        """
+        m = Makefile.__new__(Makefile)
+        m.__dict__.update(self.__getstate__())
+
+        m.variables = self.variables.copy()
+        m.exportedvars = self.exportedvars.copy()
+        m._targets = dict((k, t.copy(m)) for k, t in self._targets.items())
+
+        patternvariables = dict((v, v.copy()) for v in self._patternvariables.values())
+        m._patternvariables = dict((p, patternvariables[v])
+                                   for p, v in self._patternvariables.items())
+        m._patternvariablesindex = self._patternvariablesindex.copy(patternvariables)
+
+        m.implicitrules = list(self.implicitrules)
+        m._implicitruleindex = None
+        m.implicitfailures = set(self.implicitfailures)
+        m.resolvetimes = self.resolvetimes.copy()
+        m._patternvpaths = list(self._patternvpaths)
+        m._vpathtable = None
+        m.parsinginputs = set(self.parsinginputs)
+        m.parsingglobs = set(self.parsingglobs)
+        m._lazydepfiles = dict((k, list(v)) for k, v in self._lazydepfiles.items())
+        m._lazydeptargets = self._lazydeptargets.copy()
+        m.included = list(self.included)
+        return m
+
     def finishparsing(self):
         """
         Various activities, such as "eval", are not allowed after parsing is
@@ -1774,31 +2704,183 @@ class Makefile(object):
 
         self.error = False
 
+    def includemakefiles(self, makefiles, start=0):
+        """
+        Include the makefiles given on the command line, from makefiles[start].
+        """
+        for i in range(start, len(makefiles)):
+            self._toplevel = i
+            self.include(makefiles[i])
+
+    def checkpoint(self, paths):
+        """
+        Record the state of parsing before an include statement of `paths`,
+        so that if an included makefile is remade, make can restart from here
+        rather than parsing everything again.
+
+        Checkpoints are only taken when one of `paths` looks like it could be
+        remade: it is missing, or there is already a rule which could make
+        it. They can't be taken in the middle of an $(eval), or once parsing
+        has done anything which can't be repeated or checked for changes
+        (see optoutofsnapshot).
+
+        Each checkpoint copies the makefile, so to keep the cost of taking
+        them linear in its size, once the makefile is large another is only
+        taken when it has grown by half since the last.
+        """
+        if self.checkpoints is None or self.parsingfinished or self.snapshotoptout is not None:
+            return
+        if None in self.parsestack:
+            return
+        size = len(self._targets) + len(self.variables._map) + len(self.implicitrules)
+        if size < self._checkpointsize:
+            return
+        if not util.any((self._mayberemade(p) for p in paths)):
+            return
+
+        if size > 500:
+            self._checkpointsize = size + size // 2
+        self.checkpoints.append(Checkpoint(self.copy(), [(f[0], f[1], f[2].copy(), f[3]) for f in self.parsestack],
+                                           self._toplevel, len(self.included),
+                                           snapshot.getfingerprints(self.parsinginputs),
+                                           snapshot.getglobresults(self.parsingglobs)))
+
+    def _mayberemade(self, path):
+        return getmtime(util.normaljoin(self.workdir, path)) is None or self.mayhaverule(path)
+
+    def mayhaverule(self, path):
+        """
+        Could the target `path` be made by some rule? This is only a quick
+        check: it is true if there is an explicit rule for the target, or any
+        implicit rule whose target pattern matches it.
+        """
+        t = self._targets.get(path)
+        if t is not None and len(t.rules):
+            return True
+        if path in self._lazydepfiles:
+            return True
+        for r in self.implicitrules:
+            for p in r.targetpatterns:
+                if p.match(path) is not None:
+                    return True
+        return False
+
     def include(self, path, required=True, weak=False, loc=None):
         """
-        Include the makefile at `path`.
+        Include the makefiles matching `path`, which may be a glob.
+        """
+        for p in self.expandinclude(path):
+            self.includefile(p, required, weak, loc)
+
+    def expandinclude(self, path):
+        """
+        Return the paths of the makefiles to include for `path`.
         """
         if self._globcheck.search(path):
-            paths = globrelative.glob(self.workdir, path)
-        else:
-            paths = [path]
+            globsread = []
+            paths = globrelative.glob(self.workdir, path, globsread)
+            self.addparsingglobs(globsread)
+            return paths
+        return [path]
+
+    def includefile(self, path, required=True, weak=False, loc=None):
+        """
+        Include the makefile at `path`.
+        """
+        self.included.append((path, required))
+        fspath = util.normaljoin(self.workdir, path)
+        self.addparsinginputs([fspath])
+        mtime = getmtime(fspath)
+        if weak and self.depslog is not None and self.depslog.haslogged(fspath, mtime):
+            _log.debug("Skipping %s: its dependencies are in the deps log", path)
+            return
+        if mtime is not None:
+            self.variables.append('MAKEFILE_LIST', Variables.SOURCE_AUTOMATIC, path, None, self)
+            if not weak:
+                parser.parsefile(fspath).execute(self)
+            else:
+                # The rules in dependency files are only added when one of
+                # their targets is resolved, unless they need variables
+                # expanded now. Their targets and prerequisites are marked
+                # explicit now, as if the rules had been added.
+                lines = parser.readdepfile(fspath)
+                deps = parser.depfiledeps(lines)
+                if deps is None:
+                    parser.depfilestatements(lines).execute(self, weak=True)
+                elif len(deps):
+                    targets = []
+                    known = self._targets
+                    for ts, prereqs in deps:
+                        for p in prereqs:
+                            # most prerequisites are listed by many files
+                            t = known.get(p)
+                            if t is None:
+                                t = self.gettarget(stripdotslash(p))
+                            t.explicit = True
+                        for t in stripdotslashes(ts):
+                            self.gettarget(t).explicit = True
+                            targets.append(t)
+                    self._lazydeptargets[fspath] = (targets, lines)
+                    for t in targets:
+                        self._lazydepfiles.setdefault(t, []).append(fspath)
+                        self.foundtarget(t)
+            self.gettarget(path).explicit = True
+
+    def includelazydeps(self, target):
+        """
+        Add the rules of the dependency files which list dependencies for
+        `target`, and whose rules haven't been added yet, as weak
+        dependencies, just as if they had been added by includedeps.
+        """
+        paths = self._lazydepfiles.pop(target, None)
+        if paths is None:
+            return
+
         for path in paths:
-            self.included.append((path, required))
-            fspath = util.normaljoin(self.workdir, path)
-            if os.path.exists(fspath):
-                if weak:
-                    stmts = parser.parsedepfile(fspath)
-                else:
-                    stmts = parser.parsefile(fspath)
-                self.variables.append('MAKEFILE_LIST', Variables.SOURCE_AUTOMATIC, path, None, self)
-                stmts.execute(self, weak=weak)
-                self.gettarget(path).explicit = True
+            entry = self._lazydeptargets.pop(path, None)
+            if entry is None:
+                continue
+
+            targets, lines = entry
+            _log.debug("Adding the rules of dependency file %s for target '%s'", path, target)
+            parser.depfilestatements(lines).execute(self, weak=True)
+
+    def applydepslog(self):
+        """
+        Add the dependencies recorded in the deps log as weak rules, as if
+        their dependency files had been included with includedeps. The log
+        records paths, and may be shared with makes in other directories, so
+        only the targets below our working directory are added, with names
+        relative to it.
+        """
+        prefix = os.path.join(self.workdir, '')
+        def relative(path):
+            if path.startswith(prefix):
+                return path[len(prefix):]
+            return path
+
+        locs = {}
+        for target, depfile, prereqs in self.depslog:
+            if not target.startswith(prefix):
+                continue
+            target = target[len(prefix):]
+            prereqs = [relative(p) for p in prereqs]
+
+            loc = locs.get(depfile)
+            if loc is None:
+                loc = locs[depfile] = parserdata.Location(depfile, 1, 0)
+            t = self.gettarget(target)
+            t.addrule(Rule(prereqs, False, loc=loc, weakdeps=True))
+            t.explicit = True
+            for p in prereqs:
+                self.gettarget(p).explicit = True
 
     def addvpath(self, pattern, dirs):
         """
         Add a directory to the vpath search for the given pattern.
         """
         self._patternvpaths.append((pattern, dirs))
+        self._vpathtable = None
 
     def clearvpath(self, pattern):
         """
@@ -1806,18 +2888,85 @@ class Makefile(object):
         """
         self._patternvpaths = [(p, dirs)
                                for p, dirs in self._patternvpaths
-                               if not p.match(pattern)]
+                               if not p == pattern]
+        self._vpathtable = None
 
     def clearallvpaths(self):
         self._patternvpaths = []
+        self._vpathtable = None
 
     def getvpath(self, target):
-        vp = list(self._vpath)
-        for p, dirs in self._patternvpaths:
-            if p.match(target):
-                vp.extend(dirs)
+        """
+        Get the directories to search for `target`: VPATH followed by the
+        directories of each matching vpath pattern, without duplicates.
+
+        The vpath patterns are compiled into a PatternIndex, and the resulting
+        list is cached for each distinct set of matching patterns. Both are
+        thrown away when a vpath directive is executed.
+        """
+        if self._vpathtable is None:
+            index = PatternIndex()
+            for i, (p, dirs) in enumerate(self._patternvpaths):
+                index.add(p, i)
+            self._vpathtable = index, {}
+
+        index, cache = self._vpathtable
+        key = tuple([i for p, i in index.match(target)])
+        vp = cache.get(key, None)
+        if vp is None:
+            vp = list(self._vpath)
+            for i in key:
+                vp.extend(self._patternvpaths[i][1])
+            vp = tuple(withoutdups(vp))
+            cache[key] = vp
+
+        return vp
+
+    def prefetchmtimes(self, threads):
+        """
+        Fill the stat cache for every known target, and the locations where
+        vpath would look for it, using `threads` threads. Targets are still
+        resolved lazily; this only makes the stat()s they need cheap.
+        """
+        assert self.parsingfinished
+
+        phony = set()
+        for rule in self.gettarget('.PHONY').rules:
+            phony.update(rule.prerequisites)
+
+        paths = []
+        for t in list(self._targets.values()):
+            if t.vpathtarget is not None or t.target.startswith('-l') or t.target in phony:
+                continue
+
+            paths.append(util.normaljoin(self.workdir, t.target))
+            if not os.path.isabs(t.target):
+                paths.extend([util.normaljoin(self.workdir, util.normaljoin(dir, t.target))
+                              for dir in self.getvpath(t.target)])
+
+        statcache.prefetch(paths, threads)
+
+    def getlibpatterns(self):
+        """
+        Get the list of Patterns in .LIBPATTERNS. This is only expanded once,
+        when the first -lNAME prerequisite is resolved after parsing.
+        """
+        assert self.parsingfinished
+
+        if self._libpatterns is None:
+            f, s, e = self.variables.get('.LIBPATTERNS')
+            if e is None:
+                libpatterns = []
+            else:
+                libpatterns = [Pattern(stripdotslash(s)) for s in e.resolvesplit(self, self.variables)]
+
+            for lp in libpatterns:
+                if not lp.ispattern():
+                    raise errors.DataError('.LIBPATTERNS contains a non-pattern')
+
+            self._libpatterns = libpatterns
 
-        return withoutdups(vp)
+        return self._libpatterns
 
     def remakemakefiles(self, cb):
         mlist = []
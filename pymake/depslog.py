@@ -0,0 +1,211 @@
+"""
+A binary log of the dependencies listed in dependency files, so that the
+files don't have to be included and parsed on every run.
+
+When the commands for a target which sets .DEPFILE have finished, the
+dependency file it names is parsed once and its rules are appended to the
+log. Later runs load the whole log with a single mmap and add its rules as
+weak dependencies, as `includedeps` would. Dependency files which have been
+logged and haven't changed since are skipped by `includedeps`, and may be
+deleted.
+
+Targets and prerequisites are recorded as paths, so that one log can be
+shared by makes running in different directories.
+
+The log starts with a header line followed by little-endian records of two
+kinds. A path record assigns the next path id to a string:
+
+    <uint32 length> <length bytes>
+
+A dependency record lists the prerequisites of a target, and the dependency
+file and its mtime they were read from. The high bit of the first word
+distinguishes it from a path record:
+
+    <uint32 0x80000000 | count> <uint32 target> <uint32 depfile>
+    <double mtime> <count * uint32 prerequisite>
+
+Later records for a target override earlier ones. The log is rewritten
+without the overridden records when it is loaded and has grown too large.
+"""
+
+import os, mmap, struct, logging
+
+_log = logging.getLogger('pymake.depslog')
+
+_header = b'# pymake deps log v2\n'
+
+_DEPSFLAG = 0x80000000
+_depsrecord = struct.Struct('<IIId')
+_pathlength = struct.Struct('<I')
+
+if bytes is str:
+    def _encode(s):
+        return s
+    _decode = _encode
+else:
+    def _encode(s):
+        return s.encode('utf-8')
+    def _decode(b):
+        return b.decode('utf-8')
+
+class DepsLog(object):
+    def __init__(self, path):
+        self.path = path
+        self._paths = [] # id -> path
+        self._ids = {} # path -> id
+        self._deps = {} # target id -> (depfile id, prerequisite ids)
+        self._depfiles = {} # depfile id -> mtime
+
+        self._fd = None
+        size, records = self._load()
+
+        if size == 0 or records > 3 * len(self._deps) + 100:
+            self._rewrite()
+        else:
+            self._fd = open(path, 'r+b')
+            # drop any record left incomplete by an interrupted write
+            self._fd.truncate(size)
+            self._fd.seek(size)
+
+    def _load(self):
+        """
+        Read the log. Return the length of its valid prefix, which is 0 if it
+        is missing or unreadable, and the number of dependency records.
+        """
+        try:
+            fd = open(self.path, 'rb')
+        except IOError:
+            return 0, 0
+
+        try:
+            size = os.fstat(fd.fileno()).st_size
+            if size < len(_header):
+                return 0, 0
+            m = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            fd.close()
+
+        try:
+            if m[:len(_header)] != _header:
+                _log.warning("Ignoring unreadable deps log %s", self.path)
+                return 0, 0
+
+            pos = len(_header)
+            records = 0
+            while pos + 4 <= size:
+                n, = _pathlength.unpack_from(m, pos)
+                if n & _DEPSFLAG:
+                    count = n & ~_DEPSFLAG
+                    start = pos + _depsrecord.size
+                    end = start + 4 * count
+                    if end > size:
+                        break
+                    n, target, depfile, mtime = _depsrecord.unpack_from(m, pos)
+                    prereqs = struct.unpack_from('<%iI' % count, m, start)
+                    if max((target, depfile) + prereqs) >= len(self._paths):
+                        break
+                    self._deps[target] = (depfile, prereqs)
+                    self._depfiles[depfile] = mtime
+                    records += 1
+                else:
+                    end = pos + 4 + n
+                    if end > size:
+                        break
+                    path = _decode(m[pos + 4:end])
+                    self._ids[path] = len(self._paths)
+                    self._paths.append(path)
+                pos = end
+
+            return pos, records
+        finally:
+            m.close()
+
+    def _rewrite(self):
+        deps = [(self._paths[target], self._paths[depfile], self._depfiles[depfile],
+                 [self._paths[p] for p in prereqs])
+                for target, (depfile, prereqs) in self._deps.items()]
+        deps.sort()
+
+        self._paths = []
+        self._ids = {}
+        self._deps = {}
+        self._depfiles = {}
+
+        tmppath = self.path + '.tmp'
+        self._fd = open(tmppath, 'wb')
+        try:
+            self._fd.write(_header)
+            for target, depfile, mtime, prereqs in deps:
+                self._write(target, depfile, mtime, prereqs)
+        finally:
+            self._fd.close()
+
+        try:
+            os.rename(tmppath, self.path)
+        except OSError:
+            # Windows can't rename over an existing file
+            os.remove(self.path)
+            os.rename(tmppath, self.path)
+
+        self._fd = open(self.path, 'ab')
+
+    def _getid(self, path):
+        id = self._ids.get(path)
+        if id is None:
+            id = len(self._paths)
+            self._ids[path] = id
+            self._paths.append(path)
+            b = _encode(path)
+            self._fd.write(_pathlength.pack(len(b)))
+            self._fd.write(b)
+        return id
+
+    def _write(self, target, depfile, mtime, prereqs):
+        target = self._getid(target)
+        depfile = self._getid(depfile)
+        prereqs = [self._getid(p) for p in prereqs]
+        self._fd.write(_depsrecord.pack(_DEPSFLAG | len(prereqs), target, depfile, mtime))
+        self._fd.write(struct.pack('<%iI' % len(prereqs), *prereqs))
+        self._deps[target] = (depfile, tuple(prereqs))
+        self._depfiles[depfile] = mtime
+
+    def record(self, depfile, mtime, deps):
+        """
+        Record the dependencies read from `depfile`, whose mtime was `mtime`.
+        `deps` is a list of (target, [prerequisite, ...]).
+        """
+        for target, prereqs in deps:
+            self._write(target, depfile, mtime, prereqs)
+        self._fd.flush()
+
+    def haslogged(self, depfile, mtime):
+        """
+        Has `depfile` been logged, and not changed since?
+        """
+        id = self._ids.get(depfile)
+        return id is not None and self._depfiles.get(id) == mtime
+
+    def __len__(self):
+        return len(self._deps)
+
+    def __iter__(self):
+        """
+        Yield (target, depfile, [prerequisite, ...]) for each logged target.
+        """
+        paths = self._paths
+        for target, (depfile, prereqs) in self._deps.items():
+            yield paths[target], paths[depfile], [paths[p] for p in prereqs]
+
+_logs = {}
+
+def getlog(path):
+    """
+    Get the DepsLog for `path`. All the makes running in this process share
+    one DepsLog per file.
+    """
+    path = os.path.normpath(path)
+    log = _logs.get(path)
+    if log is None:
+        log = DepsLog(path)
+        _logs[path] = log
+    return log
@@ -0,0 +1,130 @@
+"""
+Content digests of files, used to decide whether a target is out of date by
+comparing the contents of its prerequisites rather than their mtimes.
+
+A DigestDatabase remembers the digest of each file it has hashed, keyed by
+the file's size and mtime, so that unchanged files are only hashed once.
+It also remembers, for each target, the digests its prerequisites had when
+the target was last made. A prerequisite is only newer than a target if its
+digest has changed since then.
+"""
+
+import os, hashlib, logging
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+_log = logging.getLogger('pymake.digests')
+
+# Increase this when the database format changes.
+FORMAT = 1
+
+def hashfile(path, bufsize=65536):
+    h = hashlib.sha1()
+    fd = open(path, 'rb')
+    try:
+        while True:
+            data = fd.read(bufsize)
+            if not data:
+                break
+            h.update(data)
+    finally:
+        fd.close()
+    return h.hexdigest()
+
+class DigestDatabase(object):
+    def __init__(self, path):
+        self.path = path
+        self._files = {} # path -> (size, mtime, digest)
+        self._built = {} # target path -> {prerequisite path: digest}
+        self._dirty = False
+        self.hashed = 0
+
+        try:
+            fd = open(path, 'rb')
+        except IOError:
+            return
+
+        try:
+            try:
+                format, self._files, self._built = pickle.load(fd)
+            except Exception as e:
+                _log.warning("Ignoring unreadable digest database %s: %s", path, e)
+                return
+        finally:
+            fd.close()
+
+        if format != FORMAT:
+            self._files = {}
+            self._built = {}
+
+    def getdigest(self, path):
+        """
+        Return the digest of the file at `path`, or None if it isn't a
+        readable file.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        entry = self._files.get(path)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime:
+            return entry[2]
+
+        try:
+            digest = hashfile(path)
+        except IOError:
+            return None
+
+        self.hashed += 1
+        self._files[path] = (st.st_size, st.st_mtime, digest)
+        self._dirty = True
+        return digest
+
+    def getbuilt(self, target):
+        """
+        Return a dict of the prerequisite digests recorded when `target` was
+        last made, or None.
+        """
+        return self._built.get(target)
+
+    def setbuilt(self, target, digests):
+        self._built[target] = digests
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        tmppath = self.path + '.tmp'
+        fd = open(tmppath, 'wb')
+        try:
+            pickle.dump((FORMAT, self._files, self._built), fd, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fd.close()
+
+        try:
+            os.rename(tmppath, self.path)
+        except OSError:
+            # Windows can't rename over an existing file
+            os.remove(self.path)
+            os.rename(tmppath, self.path)
+
+        self._dirty = False
+
+_databases = {}
+
+def getdatabase(path):
+    """
+    Get the DigestDatabase for `path`. All the makes running in this process
+    share one DigestDatabase per file.
+    """
+    path = os.path.normpath(path)
+    db = _databases.get(path)
+    if db is None:
+        db = DigestDatabase(path)
+        _databases[path] = db
+    return db
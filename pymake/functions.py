@@ -4,7 +4,7 @@ Makefile functions.
 from __future__ import print_function
 
 import parser, util
-import subprocess, os, logging, sys
+import subprocess, os, logging, sys, re, site
 from globrelative import glob
 from pymake import errors
 
@@ -547,9 +547,11 @@ class WildcardFunction(Function):
     def resolve(self, makefile, variables, fd, setting):
         patterns = self._arguments[0].resolvesplit(makefile, variables, setting)
 
+        globsread = []
         fd.write(' '.join([x.replace('\\','/')
                            for p in patterns
-                           for x in glob(makefile.workdir, p)]))
+                           for x in glob(makefile.workdir, p, globsread)]))
+        makefile.addparsingglobs(globsread)
 
     @property
     def is_filesystem_dependent(self):
@@ -561,7 +563,8 @@ class RealpathFunction(Function):
     maxargs = 1
 
     def resolve(self, makefile, variables, fd, setting):
-        fd.write(' '.join([os.path.realpath(os.path.join(makefile.workdir, path)).replace('\\', '/')
+        makefile.optoutofsnapshot("$(realpath) used at %s" % (self.loc,))
+        fd.write(' '.join([util.realpath(os.path.join(makefile.workdir, path)).replace('\\', '/')
                            for path in self._arguments[0].resolvesplit(makefile, variables, setting)]))
 
     def is_filesystem_dependent(self):
@@ -713,7 +716,14 @@ class EvalFunction(Function):
 
         stmts = parser.parsestring(self._arguments[0].resolvestr(makefile, variables, setting),
                                    'evaluation from %s' % self.loc)
-        stmts.execute(makefile)
+
+        # Execution can't be resumed in the middle of an expansion, so don't
+        # take checkpoints while evaluating.
+        makefile.parsestack.append(None)
+        try:
+            stmts.execute(makefile)
+        finally:
+            makefile.parsestack.pop()
 
 class OriginFunction(Function):
     name = 'origin'
@@ -771,34 +781,254 @@ class ShellFunction(Function):
     __slots__ = Function.__slots__
 
     def resolve(self, makefile, variables, fd, setting):
-        from process import prepare_command
+        from process import prepare_command, popen
+        makefile.optoutofsnapshot("$(shell) used at %s" % (self.loc,))
         cline = self._arguments[0].resolvestr(makefile, variables, setting)
         executable, cline = prepare_command(cline, makefile.workdir, self.loc)
 
-        # subprocess.Popen doesn't use the PATH set in the env argument for
-        # finding the executable on some platforms (but strangely it does on
-        # others!), so set os.environ['PATH'] explicitly.
-        oldpath = os.environ['PATH']
-        if makefile.env is not None and 'PATH' in makefile.env:
-            os.environ['PATH'] = makefile.env['PATH']
-
         log.debug("%s: running command '%s'" % (self.loc, ' '.join(cline)))
         try:
-            p = subprocess.Popen(cline, executable=executable, env=makefile.env, shell=False,
-                                 stdout=subprocess.PIPE, cwd=makefile.workdir)
+            p = popen(cline, executable=executable, env=makefile.env, shell=False,
+                      stdout=subprocess.PIPE, cwd=makefile.workdir)
         except OSError as e:
             print("Error executing command %s" % cline[0], e, file=sys.stderr)
             return
+
+        try:
+            writeshelloutput(p.stdout, fd)
         finally:
-            os.environ['PATH'] = oldpath
+            p.stdout.close()
+            p.wait()
+
+            # The command may have created or replaced files and symlinks.
+            data.statcache.clear()
+            util.invalidaterealpath()
+
+def writeshelloutput(f, fd, bufsize=65536):
+    """
+    Copy the output of a $(shell) command from the pipe `f` to `fd` as it is
+    read, converting newlines (CRLF or LF) to spaces and dropping a single
+    trailing newline. Line endings at the end of a chunk are held back until
+    we know whether they are part of a CRLF pair or the final newline.
+    """
+    if sys.version_info[0] >= 3:
+        import io
+        f = io.TextIOWrapper(f, newline='')
+
+    pending = ''
+    while True:
+        chunk = f.read(bufsize)
+        if not chunk:
+            break
+
+        chunk = pending + chunk
+        if chunk.endswith('\r\n'):
+            pending = '\r\n'
+        elif chunk.endswith('\n') or chunk.endswith('\r'):
+            pending = chunk[-1]
+        else:
+            pending = ''
+
+        if pending:
+            chunk = chunk[:-len(pending)]
+        fd.write(chunk.replace('\r\n', '\n').replace('\n', ' '))
+
+    if pending == '\r':
+        fd.write(pending)
+
+class _LastCharWriter(object):
+    """
+    Forward writes to a file object, remembering the last character written so
+    that $(file) can decide whether a trailing newline is needed.
+    """
+
+    __slots__ = ('fd', 'last')
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.last = None
+
+    def write(self, s):
+        if s:
+            self.fd.write(s)
+            self.last = s[-1]
+
+class FileFunction(Function):
+    """$(file >path,text), $(file >>path,text) and $(file <path)"""
+
+    name = 'file'
+    minargs = 1
+    maxargs = 2
+
+    __slots__ = Function.__slots__
+
+    def resolve(self, makefile, variables, fd, setting):
+        makefile.optoutofsnapshot("$(file) used at %s" % (self.loc,))
+        spec = self._arguments[0].resolvestr(makefile, variables, setting).strip()
+
+        if spec.startswith('>>'):
+            mode, path = 'a', spec[2:]
+        elif spec.startswith('>'):
+            mode, path = 'w', spec[1:]
+        elif spec.startswith('<'):
+            mode, path = 'r', spec[1:]
+        else:
+            raise errors.DataError("Invalid file operation: %s" % (spec,), self.loc)
+
+        path = path.strip()
+        if path == '':
+            raise errors.DataError("Missing filename in $(file %s)" % (spec,), self.loc)
+
+        fspath = util.normaljoin(makefile.workdir, path)
+
+        if mode == 'r':
+            if len(self._arguments) > 1:
+                raise errors.DataError("$(file <%s) does not take a text argument" % (path,), self.loc)
+
+            try:
+                f = open(fspath, 'r')
+            except IOError:
+                # GNU make silently expands to nothing for missing files.
+                return
+
+            try:
+                contents = f.read()
+            finally:
+                f.close()
+
+            if contents.endswith('\n'):
+                contents = contents[:-1]
+            fd.write(contents)
+            return
+
+        try:
+            f = open(fspath, mode)
+        except IOError as e:
+            raise errors.DataError("Error opening file %s: %s" % (path, e), self.loc)
+
+        try:
+            if len(self._arguments) > 1:
+                # Expand straight into the file instead of building the text
+                # as a string first.
+                w = _LastCharWriter(f)
+                self._arguments[1].resolve(makefile, variables, w, setting)
+                if w.last is not None and w.last != '\n':
+                    f.write('\n')
+        finally:
+            f.close()
+
+        data.statcache.invalidate(fspath)
+        util.invalidaterealpath(fspath)
+
+    @property
+    def is_filesystem_dependent(self):
+        return True
 
-        stdout, stderr = p.communicate()
-        stdout = stdout.replace('\r\n', '\n')
-        if stdout.endswith('\n'):
-            stdout = stdout[:-1]
-        stdout = stdout.replace('\n', ' ')
+def _importpymodule(module, loc):
+    """
+    Import a module for $(pycall). The caller puts PYCOMMANDPATH on sys.path
+    for the whole call, as for native commands, so that imports the function
+    makes when it runs are found too.
+    """
+    if module in sys.modules:
+        return sys.modules[module]
+
+    try:
+        __import__(module)
+    except Exception as e:
+        raise errors.DataError("Error importing %s: %s" % (module, e), loc)
+
+    return sys.modules[module]
+
+class PythonFunctionBase(Function):
+    """
+    Shared calling convention for make functions implemented in Python. Each
+    argument after the ones consumed by the subclass is expanded and split
+    into a list of words. The Python function may return a string, a sequence
+    of words, or None.
+    """
+
+    __slots__ = Function.__slots__
+
+    def callpy(self, pyfunc, args, makefile, variables, fd, setting):
+        makefile.optoutofsnapshot("Python function called at %s" % (self.loc,))
+        words = [a.resolvesplit(makefile, variables, setting) for a in args]
+        try:
+            r = pyfunc(*words)
+        except errors.MakeError:
+            raise
+        except Exception as e:
+            raise errors.DataError("Python function %s failed: %s" % (getattr(pyfunc, '__name__', pyfunc), e), self.loc)
+
+        if r is None:
+            return
+        if isinstance(r, data.str_type):
+            fd.write(r)
+        else:
+            util.joiniter(fd, r)
+
+class PyCallFunction(PythonFunctionBase):
+    """
+    $(pycall module.function,arg1,arg2,...)
+
+    Call a Python function in-process. Modules are found using PYCOMMANDPATH,
+    as for native commands.
+    """
+
+    name = 'pycall'
+    minargs = 1
+    maxargs = 0
+
+    __slots__ = Function.__slots__
+
+    def resolve(self, makefile, variables, fd, setting):
+        fname = self._arguments[0].resolvestr(makefile, variables, setting).strip()
+        module, dot, method = util.strrpartition(fname, '.')
+        if module == '' or method == '':
+            raise errors.DataError("pycall: '%s' is not of the form module.function" % (fname,), self.loc)
+
+        flavor, source, e = variables.get('PYCOMMANDPATH', True)
+        if e is None:
+            pycommandpath = []
+        else:
+            pycommandpath = [p for p in re.split('[%s\s]+' % os.pathsep,
+                                                 e.resolvestr(makefile, variables, ['PYCOMMANDPATH']))
+                             if p != '']
+
+        # This runs in the make process itself, so sys.path is restored
+        # once the function returns.
+        oldsyspath = list(sys.path)
+        try:
+            for p in pycommandpath:
+                site.addsitedir(p)
+
+            m = _importpymodule(module, self.loc)
+            pyfunc = getattr(m, method, None)
+            if pyfunc is None or not callable(pyfunc):
+                raise errors.DataError("No function named '%s' in module %s" % (method, module), self.loc)
+
+            self.callpy(pyfunc, self._arguments[1:], makefile, variables, fd, setting)
+        finally:
+            sys.path = oldsyspath
+
+def registerfunction(name, pyfunc, minargs=1, maxargs=0):
+    """
+    Make the Python callable `pyfunc` available to makefiles as $(name ...).
+    It is called with one list of words per argument; see PythonFunctionBase.
+
+    Registration affects makefiles parsed afterwards, so it should happen
+    before make execution starts.
+    """
+    if name in functionmap and not issubclass(functionmap[name], PythonFunctionBase):
+        raise errors.DataError("Cannot replace built-in function '%s'" % (name,))
+
+    def resolve(self, makefile, variables, fd, setting):
+        self.callpy(pyfunc, self._arguments, makefile, variables, fd, setting)
 
-        fd.write(stdout)
+    functionmap[name] = type('PyFunction_%s' % re.sub(r'\W', '_', name), (PythonFunctionBase,),
+                             {'name': name, 'minargs': minargs, 'maxargs': maxargs,
+                              '__slots__': Function.__slots__, 'resolve': resolve})
+    parser.functionmapchanged()
 
 class ErrorFunction(Function):
     name = 'error'
@@ -819,6 +1049,7 @@ class WarningFunction(Function):
     __slots__ = Function.__slots__
 
     def resolve(self, makefile, variables, fd, setting):
+        makefile.optoutofsnapshot("$(warning) used at %s" % (self.loc,))
         v = self._arguments[0].resolvestr(makefile, variables, setting)
         log.warning(v)
 
@@ -830,6 +1061,7 @@ class InfoFunction(Function):
     __slots__ = Function.__slots__
 
     def resolve(self, makefile, variables, fd, setting):
+        makefile.optoutofsnapshot("$(info) used at %s" % (self.loc,))
         v = self._arguments[0].resolvestr(makefile, variables, setting)
         print(v)
 
@@ -866,6 +1098,8 @@ functionmap = {
     'origin': OriginFunction,
     'flavor': FlavorFunction,
     'shell': ShellFunction,
+    'file': FileFunction,
+    'pycall': PyCallFunction,
     'error': ErrorFunction,
     'warning': WarningFunction,
     'info': InfoFunction,
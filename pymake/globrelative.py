@@ -14,19 +14,24 @@ _globcheck = re.compile('[[*?]')
 def hasglob(p):
     return _globcheck.search(p) is not None
 
-def glob(fsdir, path):
+def glob(fsdir, path, globsread=None):
     """
     Yield paths matching the path glob. Sorts as a bonus. Excludes '.' and '..'
+
+    If `globsread` is a list, a (dir, pattern) pair is appended to it for each
+    call to globpattern which determined the result.
     """
 
     dir, leaf = os.path.split(path)
     if dir == '':
-        return globpattern(fsdir, leaf)
+        return globpattern(fsdir, leaf, globsread)
 
     if hasglob(dir):
-        dirsfound = glob(fsdir, dir)
+        dirsfound = glob(fsdir, dir, globsread)
     else:
         dirsfound = [dir]
+        if globsread is not None:
+            globsread.append(os.path.split(util.normaljoin(fsdir, dir)))
 
     r = []
 
@@ -35,15 +40,18 @@ def glob(fsdir, path):
         if not os.path.isdir(fspath):
             continue
 
-        r.extend((util.normaljoin(dir, found) for found in globpattern(fspath, leaf)))
+        r.extend((util.normaljoin(dir, found) for found in globpattern(fspath, leaf, globsread)))
 
     return r
 
-def globpattern(dir, pattern):
+def globpattern(dir, pattern, globsread=None):
     """
     Return leaf names in the specified directory which match the pattern.
     """
 
+    if globsread is not None:
+        globsread.append((dir, pattern))
+
     if not hasglob(pattern):
         if pattern == '':
             if os.path.isdir(dir):
@@ -0,0 +1,221 @@
+"""
+A compact, array-backed view of the dependency graph of a makefile, used to
+answer "what needs rebuilding?" without expanding or running any commands.
+"""
+
+from array import array
+import util
+from pymake import errors
+
+# Kinds of target, as stored in DependencyGraph.kinds
+KIND_SOURCE = 0 # no rules: a file which just has to exist
+KIND_NOCOMMANDS = 1 # rules, but none with commands
+KIND_COMMANDS = 2 # a rule with commands
+KIND_ALWAYS = 3 # a double-colon rule with no prerequisites
+KIND_UNRESOLVED = 4 # only a weak prerequisite, which can't be made
+
+_MISSING = -1.0
+
+class DependencyGraph(object):
+    """
+    The dependency graph reachable from a list of goals. Targets are numbered
+    in the order they are discovered, and all per-target data lives in arrays
+    indexed by that number:
+
+    * the prerequisites of target i are prereqs[offsets[i]:offsets[i + 1]],
+      and weak[j] is 1 if prereqs[j] is a weak prerequisite (see includedeps)
+    * mtimes[i] is the mtime of the target in milliseconds, or -1 if it
+      doesn't exist, and changedmtimes[i] is the mtime its dependents compare
+      against (see Target.getchangedmtime)
+    * kinds[i] is one of the KIND_ constants
+
+    Building the graph resolves the dependencies of every reachable target,
+    just as making them would. As when making, a weak prerequisite which
+    can't be made isn't an error, but its dependents are out of date.
+    """
+
+    def __init__(self, makefile, goals, targetstack):
+        self.names = []
+        self._ids = {}
+
+        self.offsets = array('l', [0])
+        self.prereqs = array('l')
+        self.weak = array('b')
+        self.mtimes = array('d')
+        self.changedmtimes = array('d')
+        self.kinds = array('b')
+
+        # the stack each target is resolved with: its dependents, up to a
+        # goal, the first time it was found (as a strong prerequisite, if it
+        # has been)
+        self._stacks = []
+        # whether each target has been found as a prerequisite which isn't weak
+        self._strong = array('b')
+
+        for goal in goals:
+            self._getid(goal, targetstack, False)
+
+        # self.names grows as new prerequisites are discovered
+        i = 0
+        while i < len(self.names):
+            t = makefile.gettarget(self.names[i])
+            try:
+                t.resolvedeps(makefile, self._stacks[i], [], False)
+            except errors.MakeError:
+                if self._strong[i]:
+                    raise
+                self._addunresolved(i)
+            else:
+                self._addtarget(i, t, makefile)
+            i += 1
+
+        # a target found as a weak prerequisite first may have been found as
+        # a strong one since
+        for i in range(len(self.names)):
+            if self.kinds[i] == KIND_UNRESOLVED and self._strong[i]:
+                makefile.gettarget(self.names[i]).resolvedeps(makefile, self._stacks[i], [], False)
+
+        self._stacks = None
+
+        self._dependents = None
+
+    def _getid(self, name, targetstack, weak):
+        id = self._ids.get(name)
+        if id is None:
+            id = len(self.names)
+            self._ids[name] = id
+            self.names.append(name)
+            self._stacks.append(targetstack)
+            self._strong.append(not weak)
+        elif not weak and not self._strong[id]:
+            self._strong[id] = 1
+            self._stacks[id] = targetstack
+        return id
+
+    def _addunresolved(self, i):
+        self.mtimes.append(_MISSING)
+        self.changedmtimes.append(_MISSING)
+        self.kinds.append(KIND_UNRESOLVED)
+        self.offsets.append(len(self.prereqs))
+
+    def _addtarget(self, i, t, makefile):
+        if t.mtime is None:
+            self.mtimes.append(_MISSING)
+            self.changedmtimes.append(_MISSING)
+        else:
+            self.mtimes.append(float(int(1000 * t.mtime)))
+            self.changedmtimes.append(float(int(1000 * t.getchangedmtime(makefile))))
+
+        if not len(t.rules):
+            kind = KIND_SOURCE
+        elif t.isdoublecolon() and util.any(not len(r.prerequisites) for r in t.rules):
+            kind = KIND_ALWAYS
+        elif util.any(len(r.commands) for r in t.rules):
+            kind = KIND_COMMANDS
+        else:
+            kind = KIND_NOCOMMANDS
+        self.kinds.append(kind)
+
+        # prerequisites are made with the target on the stack; double-colon
+        # rules don't have weak prerequisites (see Target.make)
+        targetstack = self._stacks[i].push(t.target)
+        doublecolon = len(t.rules) and t.isdoublecolon()
+        for r in t.rules:
+            weak = r.weakdeps and not doublecolon
+            for p in r.prerequisites:
+                self.prereqs.append(self._getid(p, targetstack, weak))
+                self.weak.append(weak)
+        self.offsets.append(len(self.prereqs))
+
+    def __len__(self):
+        return len(self.names)
+
+    def getid(self, name):
+        return self._ids[name]
+
+    def dependents(self):
+        """
+        Return the reverse graph in the same layout: (offsets, dependents).
+        """
+        if self._dependents is None:
+            count = len(self.names)
+            offsets = array('l', [0]) * (count + 1)
+            for p in self.prereqs:
+                offsets[p + 1] += 1
+            for i in range(count):
+                offsets[i + 1] += offsets[i]
+
+            fill = array('l', offsets)
+            dependents = array('l', [0]) * len(self.prereqs)
+            for i in range(count):
+                for j in range(self.offsets[i], self.offsets[i + 1]):
+                    p = self.prereqs[j]
+                    dependents[fill[p]] = i
+                    fill[p] += 1
+
+            self._dependents = (offsets, dependents)
+        return self._dependents
+
+    def toposort(self):
+        """
+        Return the target ids as an array, each after all of its prerequisites.
+        """
+        count = len(self.names)
+        doffsets, dependents = self.dependents()
+
+        pending = array('l', [0]) * count
+        order = array('l')
+        for i in range(count):
+            pending[i] = self.offsets[i + 1] - self.offsets[i]
+            if not pending[i]:
+                order.append(i)
+
+        pos = 0
+        while pos < len(order):
+            i = order[pos]
+            pos += 1
+            for j in range(doffsets[i], doffsets[i + 1]):
+                d = dependents[j]
+                pending[d] -= 1
+                if not pending[d]:
+                    order.append(d)
+
+        if len(order) != count:
+            cycle = [self.names[i] for i in range(count) if pending[i]]
+            raise errors.ResolutionError("Dependency cycle among targets: %s" % ' '.join(cycle))
+
+        return order
+
+    def outofdate(self):
+        """
+        Compute which targets need remaking, using the same rules as
+        RemakeRuleContext.runcommands: a target is remade if it doesn't exist,
+        if a prerequisite will be remade or is a weak one which can't be made,
+        or if it has commands and a prerequisite is newer. Return an array of
+        flags indexed by target id.
+        """
+        stale = array('b', [0]) * len(self.names)
+        offsets, prereqs, mtimes, kinds = self.offsets, self.prereqs, self.mtimes, self.kinds
+        changedmtimes = self.changedmtimes
+
+        for i in self.toposort():
+            kind = kinds[i]
+            if kind == KIND_SOURCE or kind == KIND_UNRESOLVED:
+                continue
+
+            mtime = mtimes[i]
+            if mtime == _MISSING or kind == KIND_ALWAYS:
+                stale[i] = 1
+                continue
+
+            for j in range(offsets[i], offsets[i + 1]):
+                p = prereqs[j]
+                if stale[p] or kinds[p] == KIND_UNRESOLVED or (kind == KIND_COMMANDS and changedmtimes[p] > mtime):
+                    stale[i] = 1
+                    break
+
+        return stale
+
+    def outofdatetargets(self):
+        stale = self.outofdate()
+        return [self.names[i] for i in range(len(self.names)) if stale[i]]
@@ -99,14 +99,26 @@ def enumeratelines(s, filename):
 
     yield Data(s, off, len(s), parserdata.Location(filename, lineno, 0))
 
-_alltokens = re.compile(r'''\\*\# | # hash mark preceeded by any number of backslashes
+def _compiletokens():
+    return re.compile(r'''\\*\# | # hash mark preceeded by any number of backslashes
                             := |
                             \+= |
                             \?= |
                             :: |
                             (?:\$(?:$|[\(\{](?:%s)\s+|.)) | # dollar sign followed by EOF, a function keyword with whitespace, or any character
                             :(?![\\/]) | # colon followed by anything except a slash (Windows path detection)
-                            [=#{}();,|'"]''' % '|'.join(functions.functionmap.keys()), re.VERBOSE)
+                            [=#{}();,|'"]''' % '|'.join([re.escape(f) for f in functions.functionmap.keys()]), re.VERBOSE)
+
+_alltokens = _compiletokens()
+
+def functionmapchanged():
+    """
+    Called when a function is registered in functions.functionmap. Makefiles
+    that were parsed (and cached) before then need to be parsed again.
+    """
+    global _alltokens, _parsecache
+    _alltokens = _compiletokens()
+    _parsecache = util.MostUsedCache(50, _parsefile, _checktime)
 
 def iterdata(d, offset, tokenlist, it):
     """
@@ -367,7 +379,7 @@ def parsefile(pathname):
     makefiles that have already been parsed and have not changed.
     """
 
-    pathname = os.path.realpath(pathname)
+    pathname = util.realpath(pathname)
     return _parsecache.get(pathname)
 
 # colon followed by anything except a slash (Windows path detection)
@@ -375,26 +387,50 @@ _depfilesplitter = re.compile(r':(?![\\/])')
 # simple variable references
 _vars = re.compile('\$\((\w+)\)')
 
-def parsedepfile(pathname):
+def _depfilelines(lines):
     """
-    Parse a filename listing only depencencies into a parserdata.StatementList.
-    Simple variable references are allowed in such files.
+    Join the continued lines of a dependency file, skipping empty lines.
     """
-    def continuation_iter(lines):
+    current_line = []
+    for line in lines:
+        line = line.rstrip()
+        if line.endswith("\\"):
+            current_line.append(line.rstrip("\\"))
+            continue
+        if not len(line):
+            continue
+        current_line.append(line)
+        yield ''.join(current_line)
         current_line = []
-        for line in lines:
-            line = line.rstrip()
-            if line.endswith("\\"):
-                current_line.append(line.rstrip("\\"))
-                continue
-            if not len(line):
-                continue
-            current_line.append(line)
-            yield ''.join(current_line)
-            current_line = []
-        if current_line:
-            yield ''.join(current_line)
+    if current_line:
+        yield ''.join(current_line)
 
+def readdepfile(pathname):
+    """
+    Read the lines of a dependency file, joining continued lines.
+    """
+    return list(_depfilelines(open(util.realpath(pathname)).readlines()))
+
+def depfiledeps(lines):
+    """
+    Split the lines of a dependency file into a list of ([target, ...],
+    [prerequisite, ...]), without building any statements. Return None if
+    the file contains variable references, which must be expanded when it is
+    included.
+    """
+    deps = []
+    for line in lines:
+        if '$' in line:
+            return None
+        target, prereqs = _depfilesplitter.split(line, 1)
+        deps.append((target.split(), prereqs.split()))
+    return deps
+
+def depfilestatements(lines):
+    """
+    Turn the lines of a dependency file into a parserdata.StatementList.
+    Simple variable references are allowed in such files.
+    """
     def get_expansion(s):
         if '$' in s:
             expansion = data.Expansion()
@@ -412,14 +448,20 @@ def parsedepfile(pathname):
 
         return data.StringExpansion(s, None)
 
-    pathname = os.path.realpath(pathname)
     stmts = parserdata.StatementList()
-    for line in continuation_iter(open(pathname).readlines()):
+    for line in lines:
         target, deps = _depfilesplitter.split(line, 1)
         stmts.append(parserdata.Rule(get_expansion(target),
                                      get_expansion(deps), False))
     return stmts
 
+def parsedepfile(pathname):
+    """
+    Parse a filename listing only depencencies into a parserdata.StatementList.
+    Simple variable references are allowed in such files.
+    """
+    return depfilestatements(readdepfile(pathname))
+
 def parsestring(s, filename):
     """
     Parse a string containing makefile data into a parserdata.StatementList.
@@ -69,7 +69,9 @@ def _expandwildcards(makefile, tlist):
         if not hasglob(t):
             yield t
         else:
-            l = glob(makefile.workdir, t)
+            globsread = []
+            l = glob(makefile.workdir, t, globsread)
+            makefile.addparsingglobs(globsread)
             for r in l:
                 yield r
 
@@ -797,9 +799,13 @@ class Include(Statement):
         self.weak = weak
 
     def execute(self, makefile, context):
-        files = self.exp.resolvesplit(makefile, makefile.variables)
+        files = list(self.exp.resolvesplit(makefile, makefile.variables))
+        makefile.checkpoint(files)
+        paths = []
         for f in files:
-            makefile.include(f, self.required, loc=self.exp.loc, weak=self.weak)
+            paths.extend(makefile.expandinclude(f))
+        _includefrom(makefile, makefile.parsestack[-1],
+                     (tuple(paths), self.required, self.weak, self.exp.loc), 0)
 
     def dump(self, fd, indent):
         print("%sInclude %s" % (indent, self.exp), file=fd)
@@ -973,6 +979,53 @@ class _EvalContext(object):
     def __init__(self, weak):
         self.weak = weak
 
+    def copy(self):
+        c = _EvalContext(self.weak)
+        if hasattr(self, 'currule'):
+            c.currule = self.currule
+        return c
+
+def _includefrom(makefile, frame, include, start):
+    """
+    Include makefiles for an include statement, from the one at `start`.
+    `include` is (paths, required, weak, loc). While each file is included
+    the frame records it, so that parsing can be resumed after it.
+    """
+    paths, required, weak, loc = include
+    try:
+        for i in range(start, len(paths)):
+            frame[3] = (include, i)
+            makefile.includefile(paths[i], required, weak=weak, loc=loc)
+    finally:
+        frame[3] = None
+
+def resumeexecution(makefile, frames):
+    """
+    Resume executing statements from a checkpoint (see
+    data.Makefile.checkpoint). `frames` is a list of (statements, index,
+    context, including), from the outermost statement list being executed
+    to the innermost. The innermost statement at `index` is executed again.
+    Then for each outer list, the rest of the files of the include
+    statement it was executing, if any, are included, and the statements
+    after it are executed.
+    """
+    stack = makefile.parsestack
+    depth = len(stack)
+    stack.extend([list(f) for f in frames])
+    try:
+        frame = stack[-1]
+        frame[0]._executefrom(makefile, frame, frame[1])
+        stack.pop()
+        while len(stack) > depth:
+            frame = stack[-1]
+            if frame[3] is not None:
+                include, i = frame[3]
+                _includefrom(makefile, frame, include, i + 1)
+            frame[0]._executefrom(makefile, frame, frame[1] + 1)
+            stack.pop()
+    finally:
+        del stack[depth:]
+
 class StatementList(list):
     """
     A list of Statement instances.
@@ -992,8 +1045,21 @@ class StatementList(list):
         if context is None:
             context = _EvalContext(weak=weak)
 
-        for s in self:
-            s.execute(makefile, context)
+        # [statements, index of the current statement, context, the include
+        # statement's files and the index of the one being included, if the
+        # current statement is an include]
+        frame = [self, 0, context, None]
+        makefile.parsestack.append(frame)
+        try:
+            self._executefrom(makefile, frame, 0)
+        finally:
+            makefile.parsestack.pop()
+
+    def _executefrom(self, makefile, frame, start):
+        context = frame[2]
+        for i in range(start, len(self)):
+            frame[1] = i
+            self[i].execute(makefile, context)
 
     def dump(self, fd, indent):
         for s in self:
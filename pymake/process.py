@@ -287,6 +287,24 @@ def statustoresult(status):
 
     return status >>8
 
+def popen(argv, executable, shell, env, cwd, **kwargs):
+    """
+    subprocess.Popen, looking up the executable using the PATH from `env`.
+
+    subprocess.Popen doesn't use the PATH set in the env argument for
+    finding the executable on some platforms (but strangely it does on
+    others!), so set os.environ['PATH'] explicitly while starting the
+    process. See http://bugs.python.org/issue8557 for a general overview of
+    "subprocess PATH semantics and portability".
+    """
+    oldpath = os.environ['PATH']
+    try:
+        if env is not None and 'PATH' in env:
+            os.environ['PATH'] = env['PATH']
+        return subprocess.Popen(argv, executable=executable, shell=shell, env=env, cwd=cwd, **kwargs)
+    finally:
+        os.environ['PATH'] = oldpath
+
 class Job(object):
     """
     A single job to be executed on the process pool.
@@ -321,23 +339,15 @@ class PopenJob(Job):
 
     def run(self):
         assert os.getpid() != self.parentpid
-        # subprocess.Popen doesn't use the PATH set in the env argument for
-        # finding the executable on some platforms (but strangely it does on
-        # others!), so set os.environ['PATH'] explicitly. This is parallel-
-        # safe because pymake uses separate processes for parallelism, and
-        # each process is serial. See http://bugs.python.org/issue8557 for a
-        # general overview of "subprocess PATH semantics and portability".
-        oldpath = os.environ['PATH']
+        # popen() temporarily sets os.environ['PATH']. This is parallel-safe
+        # because pymake uses separate processes for parallelism, and each
+        # process is serial.
         try:
-            if self.env is not None and 'PATH' in self.env:
-                os.environ['PATH'] = self.env['PATH']
-            p = subprocess.Popen(self.argv, executable=self.executable, shell=self.shell, env=self.env, cwd=self.cwd)
+            p = popen(self.argv, executable=self.executable, shell=self.shell, env=self.env, cwd=self.cwd)
             return p.wait()
         except OSError as e:
             print(e, file=sys.stderr)
             return -127
-        finally:
-            os.environ['PATH'] = oldpath
 
 class PythonJob(Job):
     """
@@ -0,0 +1,118 @@
+"""
+A log of when the contents of .RESTAT targets last changed.
+
+When the commands for a .RESTAT target rewrite it with the same contents, it
+keeps its new mtime, so that it stays newer than its prerequisites, but its
+dependents should compare against the time its contents last changed. That
+time is recorded in a log in the target's directory, so that later makes see
+it too. Each line of the log records the mtime of a file, the mtime its
+contents last changed, and its name:
+
+    <mtime> <changed> <name>
+
+A record only applies while the file still has that mtime. Later lines
+override earlier ones. The file is rewritten without the overridden lines
+when it is loaded and has grown too large.
+"""
+
+import os
+
+_header = '# pymake restat log v1\n'
+
+FILENAME = '.pymake-restat'
+
+class RestatLog(object):
+    def __init__(self, path):
+        self.path = path
+        self._entries = {} # name -> (mtime, changed)
+        self._fd = None
+
+        lines = 0
+        try:
+            fd = open(path, 'r')
+        except IOError:
+            return
+
+        try:
+            if fd.readline() == _header:
+                for line in fd:
+                    parts = line.rstrip('\n').split(' ', 2)
+                    if len(parts) != 3:
+                        continue
+                    try:
+                        self._entries[parts[2]] = (float(parts[0]), float(parts[1]))
+                    except ValueError:
+                        continue
+                    lines += 1
+        finally:
+            fd.close()
+
+        if lines > 3 * len(self._entries) + 100:
+            self._rewrite()
+
+    def _rewrite(self):
+        tmppath = self.path + '.tmp'
+        fd = open(tmppath, 'w')
+        try:
+            fd.write(_header)
+            for name, (mtime, changed) in sorted(self._entries.items()):
+                fd.write('%r %r %s\n' % (mtime, changed, name))
+        finally:
+            fd.close()
+
+        try:
+            os.rename(tmppath, self.path)
+        except OSError:
+            # Windows can't rename over an existing file
+            os.remove(self.path)
+            os.rename(tmppath, self.path)
+
+    def getchanged(self, name, mtime):
+        """
+        Return when the contents of `name` last changed, given that its mtime
+        is `mtime`.
+        """
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != mtime:
+            return mtime
+        return entry[1]
+
+    def record(self, name, mtime, changed):
+        """
+        Record that the contents of `name`, whose mtime is `mtime`, last
+        changed at `changed`.
+        """
+        if self._fd is None:
+            if not os.path.exists(self.path):
+                self._rewrite()
+            self._fd = open(self.path, 'a')
+
+        self._entries[name] = (mtime, changed)
+        self._fd.write('%r %r %s\n' % (mtime, changed, name))
+        self._fd.flush()
+
+_logs = {}
+
+def _getlog(dir):
+    log = _logs.get(dir)
+    if log is None:
+        log = RestatLog(os.path.join(dir, FILENAME))
+        _logs[dir] = log
+    return log
+
+def getchangedmtime(path, mtime):
+    """
+    Return when the contents of the file at `path`, whose mtime is `mtime`,
+    last changed. This is `mtime` unless it is a .RESTAT target which was
+    rewritten without changing.
+    """
+    dir, name = os.path.split(os.path.normpath(path))
+    return _getlog(dir).getchanged(name, mtime)
+
+def record(path, mtime, changed):
+    """
+    Record that the contents of the file at `path`, whose mtime is `mtime`,
+    last changed at `changed`.
+    """
+    dir, name = os.path.split(os.path.normpath(path))
+    _getlog(dir).record(name, mtime, changed)
@@ -0,0 +1,156 @@
+"""
+Snapshots of parsed makefiles, so that a build whose makefiles haven't
+changed can skip parsing them.
+
+A snapshot is written right after parsing finishes, before any makefiles are
+remade or any dependencies are resolved. It records the stat fingerprint of
+every file that was read while parsing, such as included makefiles, and the
+result of every directory glob, such as those done by $(wildcard). A later
+run with the same command line and environment loads the snapshot instead of
+parsing, if every fingerprint and glob result still matches.
+
+Makefiles whose parsing had side effects or read something which can't be
+fingerprinted, such as $(shell) or $(info) at parse time, are never
+snapshotted.
+"""
+
+import os, sys, hashlib, logging
+from globrelative import globpattern
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+_log = logging.getLogger('pymake.snapshot')
+
+# Increase this when the snapshot format changes.
+FORMAT = 1
+
+def _pymakesources():
+    dir = os.path.dirname(os.path.abspath(__file__))
+    return [os.path.join(dir, f) for f in os.listdir(dir) if f.endswith('.py')]
+
+def _fingerprint(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+def _globresult(dir, pattern):
+    try:
+        return globpattern(dir, pattern)
+    except OSError:
+        return None
+
+def getfingerprints(paths):
+    """
+    Return the stat fingerprint of each of `paths`, as a list of
+    (path, fingerprint).
+    """
+    return [(p, _fingerprint(p)) for p in paths]
+
+def getglobresults(globs):
+    """
+    Return the result of each (dir, pattern) glob, as a list of
+    (dir, pattern, result).
+    """
+    return [(dir, pattern, _globresult(dir, pattern)) for dir, pattern in globs]
+
+def checkinputs(fingerprints, globs):
+    """
+    Check fingerprints and glob results against the filesystem. Return a
+    description of the first one which has changed, or None.
+    """
+    for p, fingerprint in fingerprints:
+        if _fingerprint(p) != fingerprint:
+            return "'%s' has changed" % (p,)
+
+    for dir, pattern, result in globs:
+        if _globresult(dir, pattern) != result:
+            return "the files matching '%s' have changed" % (os.path.join(dir, pattern),)
+
+    return None
+
+def getkey(*args):
+    """
+    Hash everything besides the makefiles themselves which could affect
+    parsing: the arguments should include the working directory, command
+    line and environment.
+    """
+    return hashlib.sha1(repr((sys.executable, sys.version) + args).encode('utf-8')).hexdigest()
+
+def save(makefile, path, key):
+    """
+    Write a snapshot of `makefile`, which must have just finished parsing.
+    Return False if the makefile can't be snapshotted.
+    """
+    assert makefile.parsingfinished
+
+    if makefile.snapshotoptout is not None:
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+
+    inputs = sorted(makefile.parsinginputs)
+    inputs.extend(_pymakesources())
+    fingerprints = getfingerprints(inputs)
+    globs = getglobresults(sorted(makefile.parsingglobs))
+
+    tmppath = path + '.tmp'
+    fd = open(tmppath, 'wb')
+    try:
+        try:
+            pickle.dump((FORMAT, key, fingerprints, globs), fd, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(makefile, fd, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fd.close()
+    except (pickle.PicklingError, TypeError) as e:
+        _log.warning("Could not write snapshot %s: %s", path, e)
+        os.remove(tmppath)
+        return False
+
+    try:
+        os.rename(tmppath, path)
+    except OSError:
+        # Windows can't rename over an existing file
+        os.remove(path)
+        os.rename(tmppath, path)
+
+    _log.info("Wrote snapshot of %i makefile inputs and %i globs to %s", len(fingerprints), len(globs), path)
+    return True
+
+def load(path, key, context):
+    """
+    Load the snapshot at `path` if it is still valid for `key`, and attach it
+    to the execution `context`. Return None if there is no valid snapshot.
+    """
+    try:
+        fd = open(path, 'rb')
+    except IOError:
+        return None
+
+    try:
+        try:
+            format, snapshotkey, fingerprints, globs = pickle.load(fd)
+        except Exception as e:
+            _log.info("Ignoring unreadable snapshot %s: %s", path, e)
+            return None
+
+        if format != FORMAT or snapshotkey != key:
+            _log.info("Ignoring snapshot %s: it was taken with different options or environment", path)
+            return None
+
+        reason = checkinputs(fingerprints, globs)
+        if reason is not None:
+            _log.info("Ignoring snapshot %s: %s", path, reason)
+            return None
+
+        makefile = pickle.load(fd)
+    finally:
+        fd.close()
+
+    makefile.context = context
+    _log.info("Loaded snapshot %s", path)
+    return makefile
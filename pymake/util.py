@@ -9,6 +9,65 @@ def normaljoin(path, suffix):
         result = os.path.normpath(result)
     return result
 
+_realpathcache = {}
+
+# Maps a path to the cached paths whose resolution went through it: the
+# entries directly below it, and those that resolved to or directly below it
+# through a symlink. Entries may be stale; that only costs a spurious miss.
+_realpathdependents = {}
+
+def _adddependent(path, key):
+    s = _realpathdependents.get(path, None)
+    if s is None:
+        _realpathdependents[path] = s = set()
+    s.add(key)
+
+def realpath(path):
+    """
+    A caching os.path.realpath. Directory prefixes are resolved (and cached)
+    separately, so paths sharing a parent directory only pay for the lstat of
+    their last component. Paths containing '..' are resolved uncached by
+    os.path.realpath, because collapsing them lexically is not symlink-safe.
+    """
+    if os.pardir in path.replace(os.sep, '/').split('/'):
+        return os.path.realpath(path)
+
+    path = os.path.normpath(os.path.abspath(path))
+    r = _realpathcache.get(path, None)
+    if r is None:
+        dir, base = os.path.split(path)
+        if base == '':
+            r = path
+        else:
+            _adddependent(dir, path)
+            r = os.path.join(realpath(dir), base)
+            if os.path.islink(r):
+                r = os.path.realpath(r)
+            if r != path:
+                _adddependent(r, path)
+                _adddependent(os.path.dirname(r), path)
+        _realpathcache[path] = r
+
+    return r
+
+def invalidaterealpath(path=None):
+    """
+    Forget cached realpath() results for `path` and anything resolved through
+    it, because it may have been replaced by (or with) a symlink. Only those
+    entries are visited, not the whole cache. With no argument the whole
+    cache is dropped.
+    """
+    if path is None:
+        _realpathcache.clear()
+        _realpathdependents.clear()
+        return
+
+    pending = [os.path.normpath(os.path.abspath(path))]
+    while len(pending):
+        p = pending.pop()
+        _realpathcache.pop(p, None)
+        pending.extend(_realpathdependents.pop(p, ()))
+
 def joiniter(fd, it):
     """
     Given an iterator that returns strings, write the words with a space in between each.
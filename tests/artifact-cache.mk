@@ -0,0 +1,46 @@
+#T gmake skip
+#T commandline: ['--artifact-cache=artifact-cache']
+
+# Test that --artifact-cache restores a target made from the same
+# prerequisite contents instead of running its commands, and that
+# rebuilding a restored target without the cache leaves the cache alone.
+
+SUB = $(MAKE) -f $(TESTPATH)/artifact-cache.mk artifact-cache-out
+COUNT = test `wc -l < artifact-cache-count` -eq
+
+all:
+	echo one > artifact-cache-src
+	$(SUB)
+	$(COUNT) 1
+	rm artifact-cache-out
+	$(SUB)
+	$(COUNT) 1
+	test "`cat artifact-cache-out`" = "built one"
+	echo two > artifact-cache-src
+	$(SUB)
+	$(COUNT) 2
+	test "`cat artifact-cache-out`" = "built two"
+	echo one > artifact-cache-src
+	$(SUB)
+	$(COUNT) 2
+	test "`cat artifact-cache-out`" = "built one"
+	rm artifact-cache-out
+	$(SUB) EXTRA=x
+	$(COUNT) 3
+	test "`cat artifact-cache-out`" = "built one x"
+	rm artifact-cache-out
+	$(SUB)
+	$(COUNT) 3
+	echo two > artifact-cache-src
+	MAKEFLAGS= $(SUB)
+	$(COUNT) 4
+	test "`cat artifact-cache-out`" = "built two"
+	echo one > artifact-cache-src
+	$(SUB)
+	$(COUNT) 4
+	test "`cat artifact-cache-out`" = "built one"
+	@echo TEST-PASS
+
+artifact-cache-out: artifact-cache-src
+	echo built `cat $<` $(EXTRA) > $@
+	echo $@ >> artifact-cache-count
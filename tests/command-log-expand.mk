@@ -0,0 +1,28 @@
+#T gmake skip
+#T commandline: ['--command-log=command-log-expand.log']
+
+# Test that --command-log expands the commands of each target at most once,
+# and not at all for targets which are up to date, so that functions with
+# side effects in them run once per rebuild.
+
+SUB = $(MAKE) -f $(TESTPATH)/command-log-expand.mk command-log-expand-out
+COUNT = test `wc -l < command-log-expand-rsp` -eq
+
+all:
+	touch command-log-expand-src
+	$(SUB) FLAGS=1
+	$(COUNT) 1
+	$(SUB) FLAGS=1
+	$(COUNT) 1
+	$(SUB) FLAGS=2
+	$(COUNT) 2
+	touch -t 200001010000 command-log-expand-out
+	$(SUB) FLAGS=2
+	$(COUNT) 3
+	$(SUB) FLAGS=2
+	$(COUNT) 3
+	@echo TEST-PASS
+
+command-log-expand-out: command-log-expand-src
+	$(file >>command-log-expand-rsp,$(FLAGS) $?)
+	echo built $(FLAGS) > $@
@@ -0,0 +1,26 @@
+#T gmake skip
+#T commandline: ['--command-log=command-recursive.log']
+
+# Test that a relative --command-log is resolved once, so submakes in other
+# directories share the top-level log instead of each writing their own, and
+# that targets with the same name in different directories don't share an
+# entry.
+
+SUB = $(MAKE) -f $(TESTPATH)/command-log-recursive.mk command-log-recursive-out
+COUNT = test `cat command-log-recursive-d*/command-log-recursive-out | wc -l` -eq
+
+all:
+	mkdir -p command-log-recursive-d1 command-log-recursive-d2
+	$(SUB) -C command-log-recursive-d1 DIR=d1
+	$(SUB) -C command-log-recursive-d2 DIR=d2
+	$(COUNT) 2
+	$(SUB) -C command-log-recursive-d1 DIR=d1
+	$(SUB) -C command-log-recursive-d2 DIR=d2
+	$(COUNT) 2
+	test ! -e command-log-recursive-d1/command-recursive.log
+	grep -q '/command-log-recursive-d1/command-log-recursive-out$$' command-recursive.log
+	grep -q '/command-log-recursive-d2/command-log-recursive-out$$' command-recursive.log
+	@echo TEST-PASS
+
+command-log-recursive-out:
+	echo $(DIR) >> $@
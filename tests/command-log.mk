@@ -0,0 +1,31 @@
+#T gmake skip
+#T commandline: ['--command-log=command.log']
+
+# Test that --command-log remakes targets whose commands have changed, and
+# only those. $? in the commands doesn't count as a change.
+
+SUB = $(MAKE) -f $(TESTPATH)/command-log.mk command-log-out
+COUNT = test `wc -l < command-log-count` -eq
+
+all:
+	touch command-log-src
+	$(SUB) FLAGS=1
+	$(COUNT) 1
+	$(SUB) FLAGS=1
+	$(COUNT) 1
+	$(SUB) FLAGS=2
+	$(COUNT) 2
+	test "`cat command-log-out`" = "built 2"
+	$(SUB) FLAGS=2
+	$(COUNT) 2
+	touch -t 200001010000 command-log-out
+	$(SUB) FLAGS=2
+	$(COUNT) 3
+	$(SUB) FLAGS=2
+	$(COUNT) 3
+	grep -q '/command-log-out$$' command.log
+	@echo TEST-PASS
+
+command-log-out: command-log-src
+	echo built $(FLAGS) $? > $@
+	echo $@ >> command-log-count
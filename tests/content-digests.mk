@@ -0,0 +1,25 @@
+#T gmake skip
+#T commandline: ['--content-digests=digests.db']
+
+# Test that --content-digests only remakes targets whose prerequisites'
+# contents have changed, not just their mtimes.
+
+SUB = $(MAKE) -f $(TESTPATH)/content-digests.mk content-digests-out
+COUNT = test `wc -l < content-digests-count` -eq
+
+all:
+	echo one > content-digests-src
+	$(SUB)
+	$(COUNT) 1
+	touch -t 200001010000 content-digests-out
+	$(SUB)
+	$(COUNT) 1
+	echo two > content-digests-src
+	$(SUB)
+	$(COUNT) 2
+	test "`cat content-digests-out`" = "two"
+	@echo TEST-PASS
+
+content-digests-out: content-digests-src
+	cp $< $@
+	echo $@ >> content-digests-count
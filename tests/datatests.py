@@ -1,6 +1,12 @@
-import pymake.data, pymake.functions, pymake.util
+import pymake.data, pymake.functions, pymake.parser, pymake.util, pymake.artifactcache
 import unittest
 import re
+import os, shutil, sys, tempfile, threading
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
 
 
 def multitest(cls):
@@ -74,6 +80,275 @@ class LRUTest(unittest.TestCase):
             self.assertEqual(goti, di,
                              "debugitems, iteration %i, got %r expected %r" % (i, goti, di))
 
+class RealpathCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = os.path.realpath(tempfile.mkdtemp())
+        os.makedirs(os.path.join(self.dir, 'real', 'sub'))
+        os.symlink('real', os.path.join(self.dir, 'link'))
+
+    def tearDown(self):
+        pymake.util.invalidaterealpath()
+        shutil.rmtree(self.dir)
+
+    def test_matches_os_realpath(self):
+        for p in ('link', 'link/sub', 'link/sub/../sub', 'real/./sub', 'real//sub'):
+            p = os.path.join(self.dir, p)
+            self.assertEqual(pymake.util.realpath(p), os.path.realpath(p))
+
+    def test_invalidate(self):
+        p = os.path.join(self.dir, 'link', 'sub')
+        self.assertEqual(pymake.util.realpath(p), os.path.join(self.dir, 'real', 'sub'))
+
+        os.remove(os.path.join(self.dir, 'link'))
+        os.makedirs(p)
+        self.assertEqual(pymake.util.realpath(p), os.path.join(self.dir, 'real', 'sub'))
+
+        pymake.util.invalidaterealpath(os.path.join(self.dir, 'link'))
+        self.assertEqual(pymake.util.realpath(p), p)
+
+    def test_invalidate_only_dependents(self):
+        linked = os.path.join(self.dir, 'link', 'sub')
+        other = os.path.join(self.dir, 'other')
+        pymake.util.realpath(linked)
+        pymake.util.realpath(other)
+
+        # Replacing real/ changes what link/sub resolves to, but not other.
+        pymake.util.invalidaterealpath(os.path.join(self.dir, 'real'))
+        self.assertFalse(linked in pymake.util._realpathcache)
+        self.assertTrue(other in pymake.util._realpathcache)
+        self.assertTrue(self.dir in pymake.util._realpathcache)
+
+class TargetStackTest(unittest.TestCase):
+    def test_branches(self):
+        root = pymake.data.TargetStack('<command-line>')
+        a = root.push('a')
+        ab = a.push('b')
+        abc = ab.push('c')
+        ad = a.push('d')
+
+        self.assertEqual(list(abc), ['<command-line>', 'a', 'b', 'c'])
+        self.assertEqual(list(ad), ['<command-line>', 'a', 'd'])
+        self.assertEqual(len(ad), 3)
+        self.assertEqual(repr(ab), repr(['<command-line>', 'a', 'b']))
+
+        self.assertTrue('c' in abc)
+        self.assertFalse('c' in ab)
+        self.assertFalse('c' in ad)
+        self.assertFalse('b' in ad)
+        self.assertTrue('a' in ad)
+
+        # 'c' was pushed on another branch at this depth
+        adc = ad.push('c')
+        self.assertTrue('c' in adc)
+        self.assertFalse('d' in abc)
+
+    def test_empty(self):
+        s = pymake.data.TargetStack()
+        self.assertEqual(list(s), [])
+        self.assertEqual(pymake.data.getindent(s.push('a')), '')
+
+class DeepResolutionTest(unittest.TestCase):
+    def runTest(self):
+        # an implicit rule chain deeper than the Python recursion limit
+        depth = 300
+        stmts = pymake.parser.parsestring(
+            'x.0:\n' + ''.join(['%%.%i: %%.%i\n\t@:\n' % (i, i - 1)
+                                for i in range(1, depth + 1)]), 'DeepResolutionTest')
+
+        m = pymake.data.Makefile()
+        stmts.execute(m)
+        m.finishparsing()
+
+        t = m.gettarget('x.%i' % depth)
+        oldlimit = sys.getrecursionlimit()
+        sys.setrecursionlimit(depth - 100)
+        try:
+            t.resolvedeps(m, pymake.data.TargetStack(), [], False)
+        finally:
+            sys.setrecursionlimit(oldlimit)
+        self.assertEqual(len(t.rules), 1)
+        self.assertEqual(t.rules[0].prerequisites, ['x.%i' % (depth - 1)])
+        self.assertEqual(len(m.gettarget('x.1').rules), 1)
+
+class _StoreHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        self.server.files[self.path] = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class ArtifactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        pymake.artifactcache._rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        fd = open(path, 'wb')
+        fd.write(data)
+        fd.close()
+        return path
+
+    def read(self, name):
+        fd = open(os.path.join(self.dir, name), 'rb')
+        try:
+            return fd.read()
+        finally:
+            fd.close()
+
+    def test_localstore(self):
+        store = pymake.artifactcache.LocalStore(os.path.join(self.dir, 'store'), 250)
+        os.makedirs(store.dir)
+        out = os.path.join(self.dir, 'out')
+
+        self.assertFalse(store.get('aa1', [out]))
+        for key in ('aa1', 'bb2'):
+            store.put(key, [self.write('out', key.encode('ascii') * 30)])
+        os.utime(store._entrypath('aa1'), (0, 0))
+        os.utime(store._entrypath('bb2'), (1, 1))
+
+        os.remove(out)
+        self.assertTrue(store.get('aa1', [out]))
+        self.assertEqual(self.read('out'), b'aa1' * 30)
+
+        # the restored output is a copy, so rewriting it in place leaves the
+        # entry alone
+        fd = open(out, 'wb')
+        fd.write(b'changed')
+        fd.close()
+        self.assertEqual(self.read('store/aa/aa1/0'), b'aa1' * 30)
+
+        # bb2 is now the least recently used entry
+        store.put('cc3', [self.write('out', b'c' * 90)])
+        self.assertFalse(store.get('bb2', [out]))
+        self.assertTrue(store.get('aa1', [out]))
+        self.assertTrue(store.get('cc3', [out]))
+
+    def test_httpstore(self):
+        server = HTTPServer(('127.0.0.1', 0), _StoreHandler)
+        server.files = {}
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            store = pymake.artifactcache.HTTPStore('http://127.0.0.1:%i/cache/' % server.server_address[1])
+            out = os.path.join(self.dir, 'out')
+            dep = os.path.join(self.dir, 'out.pp')
+
+            self.assertFalse(store.get('k', [out, dep]))
+            store.put('k', [self.write('out', b'object'), self.write('out.pp', b'out: src')])
+            self.assertEqual(sorted(server.files), ['/cache/k/0', '/cache/k/1'])
+
+            os.remove(out)
+            os.remove(dep)
+            self.assertTrue(store.get('k', [out, dep]))
+            self.assertEqual(self.read('out'), b'object')
+            self.assertEqual(self.read('out.pp'), b'out: src')
+
+            # a partial entry is a miss, and leaves the outputs alone
+            del server.files['/cache/k/1']
+            self.assertFalse(store.get('k', [out, dep]))
+            self.assertEqual(sorted(os.listdir(self.dir)), ['out', 'out.pp'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class ImplicitRuleIndexTest(unittest.TestCase):
+    patterns = (('%.o',), ('%',), ('%.c', 'foo/%.o'), ('lib%.a',), ('%', '%.o'), ('sub/%',), ('%/foo.o',))
+    targets = ('a.o', 'foo/a.o', 'bar/foo.o', 'libx.a', 'dir/libx.a', 'x.c', 'sub/dir/y', '.o', 'o')
+
+    def runTest(self):
+        rules = [pymake.data.PatternRule([pymake.data.Pattern(p) for p in plist], [], False, None)
+                 for plist in self.patterns]
+        index = pymake.data.ImplicitRuleIndex(rules)
+
+        for target in self.targets:
+            dir, s, file = target.rpartition('/')
+            hasmatch = any((r.hasspecificmatch(file) for r in rules))
+            expected = [(ri.prule, ri.dir, ri.stem)
+                        for r in rules for ri in r.matchesfor(dir + s, file, hasmatch)]
+
+            gothasmatch, matches = index.matches(target, file)
+            got = [(ri.prule, ri.dir, ri.stem)
+                   for r, plist in matches for ri in r.matchesfor(dir + s, file, hasmatch, plist)]
+
+            self.assertEqual(gothasmatch, hasmatch, target)
+            self.assertEqual(got, expected, target)
+
+class LazyDepsTest(unittest.TestCase):
+    def runTest(self):
+        dir = tempfile.mkdtemp()
+        try:
+            fd = open(os.path.join(dir, 'x.pp'), 'w')
+            fd.write('x.o: x.h \\\n  y.h\n')
+            fd.close()
+
+            m = pymake.data.Makefile(workdir=dir)
+            m.include('x.pp', weak=True)
+
+            # prerequisites are explicit before the rules are added
+            self.assertTrue(m.gettarget('y.h').explicit)
+            self.assertEqual(len(m.gettarget('x.o').rules), 0)
+
+            m.includelazydeps('x.o')
+            rules = m.gettarget('x.o').rules
+            self.assertEqual(len(rules), 1)
+            self.assertEqual(rules[0].prerequisites, ['x.h', 'y.h'])
+            self.assertTrue(rules[0].weakdeps)
+        finally:
+            shutil.rmtree(dir)
+
+class MakefileCopyTest(unittest.TestCase):
+    def runTest(self):
+        m = pymake.data.Makefile()
+        stmts = pymake.parser.parsestring("""
+VAR = a
+%.o: PVAR = p
+t: TVAR = t
+t: x
+""", 'copytest')
+        stmts.execute(m)
+
+        c = m.copy()
+        stmts = pymake.parser.parsestring("""
+VAR += b
+%.o: PVAR += q
+t: TVAR += u
+t: y
+""", 'copytest')
+        stmts.execute(m)
+
+        def value(variables, name):
+            flavor, source, value = variables.get(name, expand=False)
+            return value
+
+        self.assertEqual(value(c.variables, 'VAR'), 'a')
+        self.assertEqual(value(m.variables, 'VAR'), 'a b')
+
+        t = c.gettarget('t')
+        self.assertTrue(t.getvariables().parent is c.variables)
+        self.assertEqual(value(t.getvariables(), 'TVAR'), 't')
+        self.assertEqual(len(t.rules), 1)
+        self.assertEqual(len(m.gettarget('t').rules), 2)
+
+        pvars = list(c.getpatternvariablesfor('x.o'))
+        self.assertEqual([value(v, 'PVAR') for v in pvars], ['p'])
+
 class EqualityTest(unittest.TestCase):
     def test_string_expansion(self):
         s1 = pymake.data.StringExpansion('foo bar', None)
@@ -0,0 +1,32 @@
+#T gmake skip
+#T commandline: ['--deps-log=deps-recursive.log']
+
+# Test that submakes in different directories can share one --deps-log:
+# each only uses the dependencies logged for its own targets.
+
+SUB = $(MAKE) -f $(TESTPATH)/deps-log-recursive.mk deps-log-recursive-out
+COUNT = test `cat deps-log-recursive-d*/deps-log-recursive-count | wc -l` -eq
+
+all:
+	mkdir -p deps-log-recursive-d1 deps-log-recursive-d2
+	touch deps-log-recursive-d1/d1.h deps-log-recursive-d2/d2.h
+	$(SUB) -C deps-log-recursive-d1 DIR=d1
+	$(SUB) -C deps-log-recursive-d2 DIR=d2
+	$(COUNT) 2
+	$(SUB) -C deps-log-recursive-d1 DIR=d1
+	$(SUB) -C deps-log-recursive-d2 DIR=d2
+	$(COUNT) 2
+	sleep 1
+	touch deps-log-recursive-d2/d2.h
+	$(SUB) -C deps-log-recursive-d1 DIR=d1
+	$(SUB) -C deps-log-recursive-d2 DIR=d2
+	$(COUNT) 3
+	test ! -e deps-log-recursive-d1/deps-recursive.log
+	@echo TEST-PASS
+
+deps-log-recursive-out: .DEPFILE = out.pp
+
+deps-log-recursive-out:
+	echo '$@: $(DIR).h' > out.pp
+	touch $@
+	echo $@ >> deps-log-recursive-count
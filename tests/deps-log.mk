@@ -0,0 +1,33 @@
+#T gmake skip
+#T commandline: ['--deps-log=deps.log']
+
+# Test that --deps-log reads the dependency file named by .DEPFILE once,
+# after the commands that wrote it, and that later runs use the logged
+# dependencies even when the dependency file is gone.
+
+SUB = $(MAKE) -f $(TESTPATH)/deps-log.mk deps-log-out
+COUNT = test `wc -l < deps-log-count` -eq
+
+all:
+	touch deps-log-src deps-log-header
+	$(SUB)
+	$(COUNT) 1
+	test -s deps.log
+	rm deps-log-out.pp
+	$(SUB)
+	$(COUNT) 1
+	touch -t 200001010000 deps-log-src deps-log-out
+	$(SUB)
+	$(COUNT) 2
+	$(SUB)
+	$(COUNT) 2
+	@echo TEST-PASS
+
+-includedeps deps-log-out.pp
+
+deps-log-out: .DEPFILE = $@.pp
+
+deps-log-out: deps-log-src
+	echo '$@: deps-log-header' > $@.pp
+	touch $@
+	echo $@ >> deps-log-count
@@ -0,0 +1,11 @@
+#T gmake skip
+# Test that a makefile written by $(file) can be included after a failed
+# -include of it: the stat cache must not remember that it was missing.
+
+-include file-function-include-gen.mk
+$(file >file-function-include-gen.mk,X = 1)
+include file-function-include-gen.mk
+
+all:
+	test "$(X)" = "1"
+	@echo TEST-PASS
@@ -0,0 +1,16 @@
+WORDS := $(foreach i,1 2 3 4 5,word$(i))
+
+$(file >list.txt,$(WORDS))
+$(file >>list.txt,second line)
+$(file >>list.txt,with,commas)
+$(file >empty.txt)
+
+READBACK := $(strip $(file <list.txt))
+MISSING := $(file <does-not-exist.txt)
+
+all:
+	test "$(READBACK)" = "word1 word2 word3 word4 word5 second line with,commas"
+	test "$(MISSING)" = ""
+	test "`wc -l < list.txt`" -eq 3
+	test ! -s empty.txt
+	@echo TEST-PASS
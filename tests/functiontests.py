@@ -2,6 +2,13 @@ import unittest
 
 import pymake.data
 import pymake.functions
+import pymake.parser
+import pymake.errors
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 class VariableRefTest(unittest.TestCase):
     def test_get_expansions(self):
@@ -50,5 +57,37 @@ class GetExpansionsTest(unittest.TestCase):
 
         self.assertFalse(f.is_filesystem_dependent)
 
+class ShellOutputTest(unittest.TestCase):
+    testdata = (
+        ('', ''),
+        ('a\n', 'a'),
+        ('a\r\nb\r\n', 'a b'),
+        ('a\n\n', 'a '),
+        ('a\rb\r', 'a\rb\r'),
+    )
+
+    def test_newlines(self):
+        for output, expected in self.testdata:
+            # A tiny buffer size exercises CRLF pairs split across reads.
+            for bufsize in (1, 2, 1024):
+                fd = StringIO()
+                pymake.functions.writeshelloutput(StringIO(output), fd, bufsize)
+                self.assertEqual(fd.getvalue(), expected)
+
+class RegisterFunctionTest(unittest.TestCase):
+    def test_register(self):
+        pymake.functions.registerfunction('reverse-words', lambda words: reversed(words))
+
+        m = pymake.data.Makefile()
+        stmts = pymake.parser.parsestring('X := $(reverse-words a b c)', 'test')
+        stmts.execute(m)
+
+        flavor, source, value = m.variables.get('X')
+        self.assertEqual(value.resolvestr(m, m.variables), 'c b a')
+
+    def test_no_builtin_override(self):
+        self.assertRaises(pymake.errors.DataError,
+                          pymake.functions.registerfunction, 'sort', sorted)
+
 if __name__ == '__main__':
     unittest.main()
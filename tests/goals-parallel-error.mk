@@ -0,0 +1,18 @@
+#T gmake skip
+#T commandline: ['-j2', 'fail', 'slow', 'notstarted']
+#T returncode: 2
+#T grep-for: "slow-finished"
+
+# Test that when a goal fails under -j, the goals already running finish,
+# no new ones are started, and make exits with status 2.
+
+fail:
+	sleep 0.2
+	exit 1
+
+slow:
+	sleep 0.5
+	@echo slow-finished
+
+notstarted: slow
+	@echo TEST-FAIL
@@ -0,0 +1,14 @@
+#T gmake skip
+#T commandline: ['-j2', 'target1', 'target2']
+
+# Test that with -j, the goals given on the command line are made
+# concurrently: target1 waits for target2 to start.
+
+target1:
+	for i in 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20; do \
+	  test -f target2-started && break; sleep 0.1; \
+	done; test -f target2-started
+	@echo TEST-PASS
+
+target2:
+	touch target2-started
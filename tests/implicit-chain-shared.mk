@@ -0,0 +1,18 @@
+# Sibling targets which share a prerequisite that cannot be made through an
+# implicit rule chain should each fall back to the next rule.
+
+$(shell touch one.raw two.raw)
+
+all: one.out two.out
+	test "$$(cat one.out)" = "fallback"
+	test "$$(cat two.out)" = "fallback"
+	@echo TEST-PASS
+
+%.mid: %.raw
+	cp $< $@
+
+%.out: %.mid common.mid
+	echo chained > $@
+
+%.out:
+	echo fallback > $@
@@ -0,0 +1,26 @@
+#T gmake skip
+#T commandline: ['-d']
+#T grep-for: "Resuming parsing from checkpoint 0, after 2 included makefiles"
+
+# Test that when parsing resumes from a checkpoint inside an included
+# makefile, the rest of the files in the outer include statement are still
+# included.
+
+include include-checkpoint-x.mk include-checkpoint-y.mk
+
+all:
+	test "$(X)" = "1"
+	test "$(Y)" = "1"
+	test "$(GEN)" = "1"
+	@echo TEST-PASS
+
+# enough variables that a checkpoint is taken inside it
+include-checkpoint-x.mk:
+	for i in $$(seq 1000); do echo "V$$i = $$i"; done > $@
+	printf 'X = 1\ninclude include-checkpoint-gen.mk\n' >> $@
+
+include-checkpoint-y.mk:
+	echo 'Y = 1' > $@
+
+include-checkpoint-gen.mk:
+	echo 'GEN = 1' > $@
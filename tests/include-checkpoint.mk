@@ -0,0 +1,25 @@
+#T gmake skip
+#T commandline: ['-d']
+#T grep-for: "Resuming parsing from checkpoint 0, after 2 included makefiles"
+
+# Test that when an included makefile is remade, parsing resumes from a
+# checkpoint taken before it was included, including from within a
+# conditional block.
+
+VAR := before
+include include-checkpoint-a.mk
+ifdef A_INCLUDED
+include include-checkpoint-b.mk
+endif
+VAR += after
+
+all:
+	test "$(VAR)" = "before a b after"
+	test "$(MAKE_RESTARTS)" = "2"
+	@echo TEST-PASS
+
+include-checkpoint-a.mk:
+	printf 'A_INCLUDED = 1\nVAR += a\n' > $@
+
+include-checkpoint-b.mk:
+	echo 'VAR += b' > $@
@@ -0,0 +1,31 @@
+#T gmake skip
+#T commandline: ['-j2', '-d']
+#T grep-for: "Not remaking included makefile include-remake-parallel-static.mk"
+
+# Test that with -j, included makefiles are remade in parallel, and that an
+# existing included makefile with no rule to remake it isn't made at all.
+
+define SLOWMAKE
+printf "$@:0:" >>results
+sleep 0.5
+printf "$@:1:" >>results
+echo 'VAR += $@' > $@
+endef
+
+EXPECTED = include-remake-parallel-a.mk:0:include-remake-parallel-b.mk:0:include-remake-parallel-a.mk:1:include-remake-parallel-b.mk:1:
+
+$(shell echo 'VAR += static' > include-remake-parallel-static.mk)
+
+include include-remake-parallel-a.mk include-remake-parallel-b.mk include-remake-parallel-static.mk
+
+all:
+	test "$$(cat results)" = "$(EXPECTED)"
+	test "$(VAR)" = "include-remake-parallel-a.mk include-remake-parallel-b.mk static"
+	@echo TEST-PASS
+
+include-remake-parallel-a.mk:
+	$(SLOWMAKE)
+
+include-remake-parallel-b.mk:
+	sleep 0.1
+	$(SLOWMAKE)
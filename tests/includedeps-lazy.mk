@@ -0,0 +1,25 @@
+#T gmake skip
+
+# Test that the rules of a dependency file included with includedeps are
+# added when one of its targets is made, and that a file listing a
+# prerequisite which can't be made is harmless while its target isn't made.
+
+SUB = $(MAKE) -f $(TESTPATH)/includedeps-lazy.mk
+
+ifdef SUBMAKE
+-includedeps lazy-deps.pp
+endif
+
+all:
+	touch -t 200001010000 lazy-target
+	touch lazy-dep
+	printf 'lazy-target: lazy-dep\nlazy-unused: lazy-missing\n' > lazy-deps.pp
+	$(SUB) SUBMAKE=1 lazy-target
+	test lazy-target -nt lazy-dep
+	@echo TEST-PASS
+
+lazy-target:
+	touch $@
+
+lazy-unused:
+	touch $@
@@ -0,0 +1,18 @@
+#T gmake skip
+$(shell \
+mkdir -p libs; \
+touch libs/libbar.a \
+)
+
+VPATH = libs
+
+# libs is listed to find -lbar before the commands for gen create
+# libs/libfoo.a, which -lfoo must then find.
+all: -lbar gen -lfoo
+	test "$^" = "libs/libbar.a gen libs/libfoo.a"
+	@echo TEST-PASS
+
+gen:
+	touch libs/libfoo.a
+
+.PHONY: gen
@@ -0,0 +1,13 @@
+$(shell \
+mkdir -p libs; \
+touch libs/libfoo.a libs/libbar.so libbaz.a \
+)
+
+VPATH = libs
+
+all: -lfoo -lbar -lbaz -lmissing
+	test "$^" = "libs/libfoo.a libs/libbar.so libbaz.a -lmissing"
+	@echo TEST-PASS
+
+-lmissing:
+	@true
@@ -0,0 +1,22 @@
+#T gmake skip
+#T commandline: ['--prefetch-mtimes=4']
+
+$(shell \
+mkdir -p src; \
+touch a.c b.o; \
+sleep 1; \
+touch a.o src/b.c; \
+)
+
+VPATH = src
+
+all: a.o b.o
+	test "$(findstring --prefetch-mtimes=4,$(MAKEFLAGS))" = "--prefetch-mtimes=4"
+	test "`cat b.o`" = "src/b.c"
+	@echo TEST-PASS
+
+a.o: a.c
+	@echo TEST-FAIL a.o is up to date
+
+b.o: b.c
+	echo $< > $@
@@ -0,0 +1,9 @@
+#T gmake skip
+PYCOMMANDPATH = $(TESTPATH) $(TESTPATH)/subdir
+
+# pycmd.delayloadfn imports a module from PYCOMMANDPATH when it is called,
+# not when pycmd is imported.
+$(pycall pycmd.delayloadfn,a)
+
+all:
+	@echo TEST-PASS
@@ -0,0 +1,11 @@
+#T gmake skip
+PYCOMMANDPATH = $(TESTPATH)
+
+SRCS = a.c b.c  c.c
+NOTHING =
+
+all:
+	test "$(pycall pycmd.pyfunc_prefix,obj/,$(SRCS))" = "obj/a.c obj/b.c obj/c.c"
+	test "$(pycall pycmd.pyfunc_count,$(SRCS),x y,$(NOTHING))" = "5"
+	test "$(pycall pycmd.pyfunc_count)" = "0"
+	@echo TEST-PASS
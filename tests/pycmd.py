@@ -36,3 +36,9 @@ def asplode_raise(args):
 
 def delayloadfn(args):
     import delayload
+
+def pyfunc_prefix(prefix, words):
+  return [prefix[0] + w for w in words]
+
+def pyfunc_count(*args):
+  return str(sum(len(a) for a in args))
@@ -0,0 +1,40 @@
+#T gmake skip
+#T grep-for: "needed by ['<command-line>', 'question-chain', 'question-chain2', 'question-missing']"
+# Test that --question reports whether targets are out of date without
+# running any commands.
+
+all:
+	touch -t 200001010000 question-src
+	touch question-out
+	$(MAKE) -q -f $(TESTPATH)/question.mk question-out
+	touch -t 200001010000 question-out
+	touch question-src
+	$(MAKE) -q -f $(TESTPATH)/question.mk question-out; test $$? = 1
+	$(MAKE) -q -f $(TESTPATH)/question.mk question-all; test $$? = 1
+	$(MAKE) -q -f $(TESTPATH)/question.mk question-phony; test $$? = 1
+	test ! -f question-ran
+	echo 'question-weak: question-gone.h' > question-weak.pp
+	touch question-weak
+	$(MAKE) -q -f $(TESTPATH)/question.mk question-weak; test $$? = 1
+	$(MAKE) -q -f $(TESTPATH)/question.mk question-chain; test $$? = 2
+	test ! -f question-ran
+	@echo TEST-PASS
+
+question-all: question-out
+
+question-out: question-src
+	touch $@ question-ran
+
+question-phony:
+	touch question-ran
+
+# a weak prerequisite which can't be made means the target is remade
+question-weak: question-src
+	touch $@ question-ran
+
+question-chain: question-chain2
+question-chain2: question-missing
+
+.PHONY: question-phony
+
+-includedeps question-weak.pp
@@ -0,0 +1,23 @@
+# Test that $(realpath) sees symlinks created by $(shell) and by commands,
+# although earlier results are cached.
+
+$(shell rm -rf realpath-shell-foo realpath-shell-real realpath-shell-cmd; mkdir realpath-shell-foo realpath-shell-real realpath-shell-cmd)
+
+A := $(realpath realpath-shell-foo)
+$(shell rmdir realpath-shell-foo; ln -s realpath-shell-real realpath-shell-foo)
+B := $(realpath realpath-shell-foo)
+
+C := $(realpath realpath-shell-cmd)
+
+all: relink
+	test "$(notdir $(A))" = "realpath-shell-foo"
+	test "$(notdir $(B))" = "realpath-shell-real"
+	test "$(notdir $(C))" = "realpath-shell-cmd"
+	test "$(notdir $(realpath realpath-shell-cmd))" = "realpath-shell-real"
+	@echo TEST-PASS
+
+relink:
+	rmdir realpath-shell-cmd
+	ln -s realpath-shell-real realpath-shell-cmd
+
+.PHONY: relink
@@ -0,0 +1,43 @@
+#T gmake skip
+
+# Test that when the commands for a .RESTAT target leave its contents
+# unchanged, its dependents aren't remade, in this make or later ones, and
+# that the target keeps its new mtime so that its commands aren't run again.
+
+SUB = $(MAKE) -f $(TESTPATH)/restat.mk restat-out
+COUNT = test `wc -l < restat-count` -eq
+GENCOUNT = test `wc -l < restat-gen-count` -eq
+CONTENT = same
+
+all:
+	touch restat-src
+	$(SUB)
+	$(COUNT) 1
+	$(GENCOUNT) 1
+	touch -t 200001010000 restat-gen
+	touch -t 200001020000 restat-out
+	touch restat-src
+	$(SUB)
+	$(COUNT) 1
+	$(GENCOUNT) 2
+	test restat-gen -nt restat-src
+	$(SUB)
+	$(SUB)
+	$(COUNT) 1
+	$(GENCOUNT) 2
+	$(MAKE) -q -f $(TESTPATH)/restat.mk restat-out
+	touch restat-src
+	$(SUB) CONTENT=different
+	$(GENCOUNT) 3
+	test "`cat restat-out`" = "different"
+	@echo TEST-PASS
+
+restat-gen: restat-src
+	echo $(CONTENT) > $@
+	echo $@ >> restat-gen-count
+
+restat-out: restat-gen
+	cp $< $@
+	echo $@ >> restat-count
+
+.RESTAT: restat-gen
@@ -0,0 +1,35 @@
+#T gmake skip
+
+# Test that --snapshot skips parsing when the makefiles and the files they
+# glob haven't changed, and reparses when they have. A snapshot which was
+# loaded rather than rewritten keeps its old timestamp.
+
+SUBMAKE = $(MAKE) --snapshot=snapshot.pickle -f snapshot-sub.mk
+OLD = touch -t 200001010000 snapshot.pickle
+ISOLD = test ! snapshot.pickle -nt snapshot-sub.mk
+ISNEW = test snapshot.pickle -nt snapshot-sub.mk
+
+all:
+	printf 'include snapshot-inc.mk\nSRCS := $$(wildcard snapshot-*.c)\nall:\n\t@echo $$(SRCS) $$(X) > snapshot.out\n' > snapshot-sub.mk
+	echo 'X = 1' > snapshot-inc.mk
+	touch snapshot-a.c
+	$(SUBMAKE)
+	test "`cat snapshot.out`" = "snapshot-a.c 1"
+	test -f snapshot.pickle
+	$(OLD)
+	$(SUBMAKE)
+	test "`cat snapshot.out`" = "snapshot-a.c 1"
+	$(ISOLD)
+	touch snapshot-b.c
+	$(SUBMAKE)
+	test "`cat snapshot.out`" = "snapshot-a.c snapshot-b.c 1"
+	$(ISNEW)
+	$(OLD)
+	echo 'X = 22' > snapshot-inc.mk
+	$(SUBMAKE)
+	test "`cat snapshot.out`" = "snapshot-a.c snapshot-b.c 22"
+	$(ISNEW)
+	echo 'Y := $$(shell echo 3)' >> snapshot-inc.mk
+	$(SUBMAKE)
+	test ! -f snapshot.pickle
+	@echo TEST-PASS
@@ -0,0 +1,13 @@
+$(shell \
+mkdir subd1 subd2; \
+touch subd1/foo.in subd2/foo.in subd1/foo.in2; \
+)
+
+vpath %.in subd1
+vpath %.in2 subd1
+vpath %.in
+vpath %.in subd2
+
+all: foo.in foo.in2
+	test "$^" = "subd2/foo.in subd1/foo.in2"
+	@echo TEST-PASS